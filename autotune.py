@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Per machine and geometry tuning of the tomopy gridrec workers and chunks
+"""
+
+from __future__ import print_function
+
+import os
+import json
+import time
+import socket
+import argparse
+import multiprocessing
+
+import numpy as np
+import tomopy
+
+__all__ = ['default_cache',
+           'calibrate',
+           'tuned',
+           'recon']
+
+# Tuned configurations, per machine, tomopy version and geometry.
+default_cache = os.path.join(os.path.expanduser('~'), '.tomobank', 'autotune.json')
+
+# Sinograms reconstructed per worker by each calibration run.
+slices_per_core = 4
+
+
+def _pow2(n):
+    return 1 << int(np.ceil(np.log2(max(1, n))))
+
+
+def _key(nproj, nslice, ncol, max_ncore):
+    key = '{}/{}/tomopy-{}/{}x{}x{}'.format(socket.gethostname(), multiprocessing.cpu_count(),
+                                             getattr(tomopy, '__version__', 'unknown'),
+                                             nproj, _pow2(nslice), ncol)
+    if max_ncore is not None:
+        key += '/{}'.format(max_ncore)
+    return key
+
+
+def _block(nslice, ncore):
+    # Largest multiple of the workers up to nslice.
+    return max(ncore, nslice // ncore * ncore) if nslice >= ncore else nslice
+
+
+def _time(data, theta, ncore, nchunk):
+    t = time.time()
+    tomopy.recon(data, theta, center=(data.shape[2] - 1) / 2.0, algorithm='gridrec',
+                 ncore=ncore, nchunk=nchunk)
+    return data.shape[1] / max(time.time() - t, 1e-9)
+
+
+def calibrate(nproj, nslice, ncol, max_ncore=None, verbose=True):
+    """
+    Time gridrec on a few synthetic sinograms of a geometry and return
+    the fastest workers, chunk and block configuration.
+
+    Each candidate reconstructs slices_per_core sinograms per worker, not
+    a whole block, and is compared in sinograms per second, so that the
+    calibration takes seconds whatever the block. The search is one
+    parameter at a time: the number of workers with tomopy's default
+    chunks, then the chunk size with the best workers. The block is the
+    largest multiple of the workers up to nslice, which keeps them
+    evenly loaded with the fewest calls.
+
+    Parameters
+    ----------
+    nproj, ncol : int
+        Projections and columns of the sinograms.
+    nslice : int
+        Sinograms per reconstruction call, the largest block.
+    max_ncore : int, optional
+        Maximum number of workers. Defaults to the number of CPUs.
+    verbose : bool, optional
+        Print each timing.
+
+    Returns
+    -------
+    dict
+        'ncore', 'nchunk' (None for tomopy's default), 'block' and the
+        'slices_s' measured.
+    """
+    if max_ncore is None:
+        max_ncore = multiprocessing.cpu_count()
+    cores = sorted(set([n for n in (1, 2, 4, 8, 16, 32, 64, 128) if n < max_ncore] + [max_ncore]))
+    cores = [n for n in cores if n <= nslice] or [1]
+    sample = min(nslice, slices_per_core * cores[-1])
+    rs = np.random.RandomState(0)
+    data = rs.random_sample((nproj, sample, ncol)).astype(np.float32)
+    theta = np.linspace(0, np.pi, nproj, endpoint=False)
+
+    # Untimed run paying for the FFT plans and the worker start up.
+    _time(data[:, :1], theta, 1, None)
+
+    def measure(ncore, nchunk):
+        rate = _time(data[:, :min(sample, slices_per_core * ncore)], theta, ncore, nchunk)
+        if verbose:
+            print ("ncore {} nchunk {}: {:.1f} slices/s".format(ncore, nchunk, rate))
+        return rate
+
+    rates = dict((n, measure(n, None)) for n in cores)
+    ncore = max(rates, key=rates.get)
+
+    chunks = [None] + [n for n in (1, 2, 4, 8, 16) if n < slices_per_core]
+    rates = dict((c, measure(ncore, c) if c is not None else rates[ncore]) for c in chunks)
+    nchunk = max(rates, key=lambda c: rates[c])
+
+    return {'ncore': ncore, 'nchunk': nchunk, 'block': _block(nslice, ncore), 'slices_s': rates[nchunk]}
+
+
+def _load(cache):
+    try:
+        with open(cache) as fp:
+            return json.load(fp)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def tuned(nproj, nslice, ncol, max_ncore=None, cache=default_cache, verbose=True, force=False):
+    """
+    Tuned gridrec configuration of a geometry, calibrated on the first
+    call on each machine and read from cache afterwards.
+
+    Geometries are keyed by projections, columns and the power of two
+    above nslice, so that calls on similar blocks share their tuning.
+
+    Parameters
+    ----------
+    nproj, nslice, ncol : int
+        Projections, sinograms and columns per reconstruction call.
+    max_ncore : int, optional
+        Maximum number of workers, e.g. from recpipe.plan_blocks.
+    cache : str, optional
+        JSON file holding the tuned configurations; None calibrates
+        every time.
+    verbose : bool, optional
+        Print the calibration timings.
+    force : bool, optional
+        Calibrate again even when cached, e.g. after a hardware change.
+
+    Returns
+    -------
+    dict
+        See calibrate.
+    """
+    key = _key(nproj, nslice, ncol, max_ncore)
+    if cache is not None and not force:
+        hit = _load(cache).get(key)
+        if hit is not None:
+            return dict(hit, block=_block(nslice, hit['ncore']))
+
+    best = calibrate(nproj, nslice, ncol, max_ncore, verbose)
+    if cache is not None:
+        dirPath = os.path.dirname(cache)
+        if dirPath and not os.path.exists(dirPath):
+            os.makedirs(dirPath)
+        # Re-read so that calibrations run in parallel all stay.
+        tunings = _load(cache)
+        tunings[key] = best
+        tmp = '{}.{}.tmp'.format(cache, os.getpid())
+        with open(tmp, 'w') as fp:
+            json.dump(tunings, fp, indent=2, sort_keys=True)
+        os.rename(tmp, cache)
+    return best
+
+
+def recon(data, theta, center, cache=default_cache, **kwargs):
+    """
+    tomopy.recon with gridrec and the tuned ncore and nchunk of the
+    geometry of data, see tuned; other keywords go to tomopy.recon.
+    """
+    conf = tuned(data.shape[0], data.shape[1], data.shape[2], cache=cache)
+    return tomopy.recon(data, theta, center=center, algorithm='gridrec',
+                        ncore=conf['ncore'], nchunk=conf['nchunk'], **kwargs)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('shape', help='projections,sinograms,columns of the reconstruction calls')
+    parser.add_argument('--max-ncore', type=int, default=None, help='maximum number of workers')
+    parser.add_argument('--cache', default=default_cache, help='JSON file of the tuned configurations')
+    parser.add_argument('--force', action='store_true', help='calibrate again even when cached')
+    args = parser.parse_args()
+
+    nproj, nslice, ncol = (int(n) for n in args.shape.split(','))
+    best = tuned(nproj, nslice, ncol, args.max_ncore, args.cache, force=args.force)
+    print (json.dumps(best, sort_keys=True))
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Convert the datasets described by JSON manifests into Data Exchange files
+"""
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import json
+import argparse
+
+import numpy as np
+import dxchange.reader as dxreader
+import dxfile.dxtomo as dx
+
+import dxconvert
+import tiffio
+
+__all__ = ['load_manifest',
+           'convert_dataset']
+
+# Keys of a dataset that hold paths relative to its root.
+path_keys = ['output', 'directory', 'proj', 'flat', 'dark', 'prefix', 'native']
+
+default_theta = {'start': 0, 'end': 180, 'extra': 0, 'decimals': None}
+
+# {name} or {name:format_spec} fields of the series strings.
+_field = re.compile(r'\{(\w+)(:[^{}]*)?\}')
+
+try:
+    string_types = (basestring,)
+except NameError:
+    string_types = (str,)
+
+
+def _expand(obj, variables):
+    """
+    Substitute {name} and {name:format_spec} fields of every string in
+    obj with variables; a string that is exactly '{name}' takes the value
+    of the variable as is, so numbers stay numbers. Braces that are not
+    fields of a variable, e.g. in a description, are left untouched.
+    """
+    if isinstance(obj, dict):
+        return dict((key, _expand(value, variables)) for key, value in obj.items())
+    if isinstance(obj, list):
+        return [_expand(value, variables) for value in obj]
+    if isinstance(obj, string_types):
+        if obj.startswith('{') and obj.endswith('}') and obj[1:-1] in variables:
+            return variables[obj[1:-1]]
+        def field(m):
+            if m.group(1) not in variables:
+                return m.group(0)
+            return ('{' + (m.group(2) or '') + '}').format(variables[m.group(1)])
+        return _field.sub(field, obj)
+    return obj
+
+
+def _merge(defaults, dataset):
+    ds = dict(defaults)
+    ds.update(dataset)
+    ds['metadata'] = dxconvert.merge_metadata(defaults.get('metadata', {}), dataset.get('metadata', {}))
+    return ds
+
+
+def load_manifest(fname, root=None):
+    """
+    Read a manifest and return the description of each of its datasets.
+
+    A manifest is a JSON object with:
+
+    defaults : dict, optional
+        Keys shared by all datasets.
+    datasets : list of dict, optional
+        One entry per dataset.
+    series : dict, optional
+        {'vars': [dict, ...], 'dataset': dict}: one dataset per entry of
+        vars, with the {name} fields of the strings of dataset replaced
+        by the values of that entry.
+
+    A dataset has a 'name', an 'output' file, a 'format' with its source
+    keys ('aps_2bm': 'directory' and 'data_index', or 'proj', 'flat' and
+    'dark' files; 'anka': 'directory', 'proj_range', 'flat_range' and
+    'dark_range'; 'tomcat': 'prefix'; 'elettra': 'native'), the
+    'metadata' description, see dxconvert.write_metadata, and optionally
+    'theta' ({'start', 'end', 'extra', 'decimals'}), 'sino', 'slab_size',
+    'chunks', 'compression', 'mode', 'block' and 'resume'. Relative paths are
+    taken from 'root', which defaults to the directory of the manifest.
+
+    Parameters
+    ----------
+    fname : str
+        Manifest file.
+    root : str, optional
+        Overrides the root of every dataset.
+
+    Returns
+    -------
+    list of dict
+        Dataset descriptions.
+    """
+    with open(fname) as fp:
+        manifest = json.load(fp)
+    defaults = manifest.get('defaults', {})
+    datasets = [_merge(defaults, ds) for ds in manifest.get('datasets', [])]
+    series = manifest.get('series')
+    if series is not None:
+        for variables in series['vars']:
+            datasets.append(_merge(defaults, _expand(series['dataset'], variables)))
+
+    base = os.path.dirname(os.path.abspath(fname))
+    for ds in datasets:
+        if 'output' not in ds or 'format' not in ds:
+            raise ValueError('{}: datasets need an output and a format'.format(fname))
+        ds.setdefault('name', os.path.splitext(os.path.basename(ds['output']))[0])
+        top = root if root is not None else os.path.join(base, ds.get('root', ''))
+        for key in path_keys:
+            if key in ds:
+                ds[key] = os.path.join(top, ds[key])
+        ds['root'] = top
+    return datasets
+
+
+def _theta(ds, nproj):
+    opt = dict(default_theta, **ds.get('theta', {}))
+    theta = np.linspace(opt['start'], opt['end'], nproj + opt['extra'])
+    if opt['decimals'] is not None:
+        theta = np.round(theta + 0.5 * 10 ** -opt['decimals'], opt['decimals'])
+    return theta
+
+
+def _aps_2bm(ds, f, layout):
+    if 'proj' in ds:
+        fnames = [ds['proj'], ds['flat'], ds['dark']]
+    else:
+        i = ds['data_index']
+        fnames = [os.path.join(ds['directory'], 'proj_{:04d}.hdf'.format(i + k)) for k in range(3)]
+    dataset = ds.get('dataset', 'exchange/data')
+    shapes = [dxconvert.dataset_shape(fname, dataset) for fname in fnames]
+    nproj, nrow, ncol = shapes[0][0]
+    start_date = dxreader.read_hdf5(fnames[0], '/file_creation_datetime')
+    extra = {'acquisition_setup': {'number_of_projections': {'value': nproj}},
+             'acquisition': {'start_date': {'value': start_date}},
+             'detector': {'dimension_x': {'value': ncol},
+                          'dimension_y': {'value': nrow}}}
+
+    def write():
+        names = ['data', 'data_white', 'data_dark']
+        if ds.get('mode', 'copy') == 'link':
+            for name, fname in zip(names, fnames):
+                dxconvert.link_dataset(f, name, fname, dataset)
+        else:
+            jobs = []
+            for name, fname, (shape, dtype) in zip(names, fnames, shapes):
+                dst = dxconvert.create_dataset(f, name, shape, dtype, **layout)
+                jobs.append((fname, dataset, dst))
+            dxconvert.ingest(jobs, ds.get('slab_size', 16))
+
+    return nproj, extra, write
+
+
+def _tiff(fnames, ds, f, layout):
+    sino = ds.get('sino')
+    shapes = [tiffio.stack_shape(names, sino) for names in fnames]
+
+    def write():
+        for name, names, (shape, dtype) in zip(['data', 'data_white', 'data_dark'], fnames, shapes):
+            dst = dxconvert.create_dataset(f, name, shape, dtype, **layout)
+            tiffio.stream_stack(names, dst, sino=sino)
+
+    return shapes[0][0][0], {}, write
+
+
+def _anka(ds, f, layout):
+    ind = [range(*ds[key]) for key in ('proj_range', 'flat_range', 'dark_range')]
+    return _tiff(tiffio.anka_fnames(ds['directory'], *ind), ds, f, layout)
+
+
+def _tomcat(ds, f, layout):
+    return _tiff(tiffio.tomcat_fnames(ds['prefix']), ds, f, layout)
+
+
+def _elettra(ds, f, layout):
+    block = ds.get('block', 32)
+    names = ['data', 'data_white', 'data_dark']
+    shapes = [dxconvert.dataset_shape(ds['native'], '/exchange/' + name) for name in names]
+
+    def write():
+        for name, (shape, dtype) in zip(names, shapes):
+            dst = dxconvert.create_dataset(f, name, (shape[1], shape[0], shape[2]), dtype,
+                                           chunks=dxconvert.transposed_chunks(shape, block),
+                                           compression=layout['compression'])
+            dxconvert.copy_transposed(ds['native'], '/exchange/' + name, dst, block)
+
+    return shapes[0][0][1], {}, write
+
+
+formats = {'aps_2bm': _aps_2bm,
+           'anka': _anka,
+           'tomcat': _tomcat,
+           'elettra': _elettra}
+
+
+def convert_dataset(ds):
+    """
+    Convert one dataset described as returned by load_manifest.
+    """
+    fname = ds['output']
+    if ds['format'] not in formats:
+        raise ValueError('unknown format: {}'.format(ds['format']))
+    if os.path.isfile(fname):
+        print ("Data Exchange file already exists: ", fname)
+        return
+
+    dirPath = os.path.dirname(fname)
+    if not os.path.exists(dirPath):
+        os.makedirs(dirPath)
+
+    # A conversion interrupted earlier resumes from its last checkpoint.
+    f = dxconvert.open_partial(fname, resume=ds.get('resume', True))
+    try:
+        layout = {'chunks': ds.get('chunks', 'projection'), 'compression': ds.get('compression')}
+        nproj, extra, write = formats[ds['format']](ds, f, layout)
+        dxconvert.write_metadata(f, dxconvert.merge_metadata(ds.get('metadata', {}), extra))
+        write()
+        f.add_entry(dx.Entry.data(theta={'value': _theta(ds, nproj), 'units':'degrees'}))
+    except Exception:
+        f.close()
+        raise
+    dxconvert.finish(f, fname)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('manifests', nargs='+', help='JSON manifest files')
+    parser.add_argument('--root', default=None, help='root of the relative paths of every dataset')
+    parser.add_argument('--only', default=None, help='comma separated names of the datasets to convert')
+    parser.add_argument('--list', action='store_true', help='print the expanded datasets and exit')
+    parser.add_argument('--workers', type=int, default=4, help='number of datasets converted in parallel')
+    parser.add_argument('--io-slots', type=int, default=2,
+                        help='maximum number of concurrent slab reads/writes across workers')
+    args = parser.parse_args()
+
+    datasets = []
+    for manifest in args.manifests:
+        datasets.extend(load_manifest(manifest, args.root))
+    if args.only is not None:
+        only = args.only.split(',')
+        datasets = [ds for ds in datasets if ds['name'] in only]
+
+    if args.list:
+        print (json.dumps(datasets, indent=2, sort_keys=True))
+    else:
+        failed = dxconvert.run_batch(convert_dataset, [(ds,) for ds in datasets],
+                                     workers=args.workers, io_slots=args.io_slots)
+        sys.exit(1 if failed else 0)
@@ -12,6 +12,8 @@ import numpy as np
 import tomopy
 import dxchange
 import dxfile.dxtomo as dx
+import dxconvert
+import tiffio
 
 if __name__ == '__main__':
 
@@ -63,13 +65,21 @@ if __name__ == '__main__':
 
     # Read the APS 2-BM raw data.
     #proj, flat, dark = dxchange.read_anka_topotomo(fname, ind_tomo, ind_flat, ind_dark, sino=(start, end))
-    proj, flat, dark = dxchange.read_anka_topotomo(fname, ind_tomo, ind_flat, ind_dark)
+    proj_fnames, flat_fnames, dark_fnames = tiffio.anka_fnames(fname, ind_tomo, ind_flat, ind_dark)
+    proj_shape, proj_dtype = tiffio.stack_shape(proj_fnames)
+    flat_shape, flat_dtype = tiffio.stack_shape(flat_fnames)
+    dark_shape, dark_dtype = tiffio.stack_shape(dark_fnames)
   
     # Set data collection angles as equally spaced between 0-180 degrees.
-    theta = np.linspace(0, 180, proj.shape[0])
+    theta = np.linspace(0, 180, proj_shape[0])
     theta = np.round(theta + 0.005, 2)
     
-    print (proj.shape, flat.shape, dark.shape, theta.shape)
+    print (proj_shape, flat_shape, dark_shape, theta.shape)
+
+    # HDF5 layout of the projections: 'projection', 'sinogram' or 'balanced' chunks,
+    # None, 'lzf', 'gzip[:level]' or 'blosc[:codec]' compression.
+    chunks = 'projection'
+    compression = None
 
     # Convert into a data-exchange file.
     fname = '/local/decarlo/conda/tomobank/datasets/' + tomobank_id + '/' + tomobank_id + '.h5'
@@ -82,8 +92,8 @@ if __name__ == '__main__':
             if not os.path.exists(dirPath):
                 os.makedirs(dirPath)
 
-            # Open DataExchange file
-            f = dx.File(fname, mode='w') 
+            # Open the partial DataExchange file, resuming an interrupted conversion
+            f = dxconvert.open_partial(fname)
 
             # Write the Data Exchange HDF5 file.
             f.add_entry(dx.Entry.experimenter(name={'value': experimenter_name}))
@@ -99,9 +109,13 @@ if __name__ == '__main__':
             f.add_entry(dx.Entry.objective(magnification={'value': objective_magnification}))
             f.add_entry(dx.Entry.scintillator(name={'value': scintillator_name}))
 
-            f.add_entry(dx.Entry.data(data={'value': proj, 'units':'counts'}))
-            f.add_entry(dx.Entry.data(data_white={'value': flat, 'units':'counts'}))
-            f.add_entry(dx.Entry.data(data_dark={'value': dark, 'units':'counts'}))
+            # Decode the tiff images in a thread pool and stream them block by block.
+            data = dxconvert.create_dataset(f, 'data', proj_shape, proj_dtype, chunks=chunks, compression=compression)
+            tiffio.stream_stack(proj_fnames, data)
+            data_white = dxconvert.create_dataset(f, 'data_white', flat_shape, flat_dtype, chunks=chunks, compression=compression)
+            tiffio.stream_stack(flat_fnames, data_white)
+            data_dark = dxconvert.create_dataset(f, 'data_dark', dark_shape, dark_dtype, chunks=chunks, compression=compression)
+            tiffio.stream_stack(dark_fnames, data_dark)
             f.add_entry(dx.Entry.data(theta={'value': theta, 'units':'degrees'}))
 
             f.add_entry(dx.Entry.acquisition(start_date={'value': start_date}))
@@ -111,7 +125,7 @@ if __name__ == '__main__':
             f.add_entry(dx.Entry.acquisition(rotation_end_angle={'value': end_angle, 'unit': end_angle_unit}))
             f.add_entry(dx.Entry.acquisition(angular_step={'value': angular_step, 'unit': angular_step_unit}))
 
-            f.close()
+            dxconvert.finish(f, fname)
  
     else:
            print ("Nothing to do ...")
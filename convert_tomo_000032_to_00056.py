@@ -2,150 +2,111 @@
 # -*- coding: utf-8 -*-
 
 """
-TomoPy example script to read APS 2-BM 
+TomoPy example script to convert the APS 2-BM H14_7075PA fatigue series (tomo_00032 to tomo_00056)
 """
 
 from __future__ import print_function
 import os
+import sys
+import argparse
 import tomopy
 import numpy as np
 import dxchange
 import dxchange.reader as dxreader
 import dxfile.dxtomo as dx
+import dxconvert
+
+sample_name = 'H14_7075PA_172HV_99NF'
+
+# (data_index, fatigue_cycle) of each cycle in the series.
+fatigue_cycles = [
+    (73, '00750'),
+    (76, '01500'),
+    (79, '02000'),
+    (82, '02750'),
+    (85, '03500'),
+    (88, '04000'),
+    (91, '04500'),
+    (94, '05500'),
+    (97, '06500'),
+    (100, '07500'),
+    (103, '08500'),
+    (106, '10000'),
+    (109, '12000'),
+    (112, '13000'),
+    (115, '13100'),
+    (118, '13200'),
+    (121, '13300'),
+    (124, '13400'),
+    (127, '13800'),
+    (130, '13900'),
+    (133, '14000'),
+    (136, '14100'),
+    (139, '14200'),
+    (142, '14300'),
+    (145, '14346'),
+    ]
+
+# Meta-data shared by all cycles, see dxconvert.write_metadata.
+metadata = {
+    'sample': {'name': {'value': sample_name}},
+    'sample_stack_setup': {'sample_detector_distance': {'value': 60, 'units': 'mm'}},
+    'attenuator': {'name': {'value': 'filter set in 2-BM-A'},
+                   'description': {'value': '1mm C + 1mm Glass'}},
+    'experiment': {'proposal': {'value': '41928'},
+                   'activity': {'value': '104291'},
+                   'title': {'value': '4D Dynamics of Stress Corrosion Cracking in High Performance Aluminum Alloy'}},
+    'experimenter': {'name': {'value': 'Nikhilesh Chawla Group'},
+                     'role': {'value': 'PI'},
+                     'affiliation': {'value': 'Arizona State University'},
+                     'address': {'value': 'School for Engineering of Matter, Transport, and Energy (SEMTE), 501 E. Tyler Mall, ECG 303, Tempe, AZ 85287-6106'},
+                     'phone': {'value': '(480) 965-2402'},
+                     'email': {'value': 'Nikhilesh.Chawla@asu.edu'}},
+    'instrument': {'name': {'value': '2-BM fast tomography'},
+                   'comment': {'value': '2-BM-A Experimental Station'}},
+    'objective': {'name': {'value': 'Mitutoyo long-working'},
+                  'description': {'value': 'a nice objective'},
+                  'manufacturer': {'value': 'Mitutoyo'},
+                  'magnification': {'value': '10x'}},
+    'acquisition_setup': {'rotation_start_angle': {'value': 0, 'units': 'deg'},
+                          'rotation_end_angle': {'value': 180, 'units': 'deg'},
+                          'rotation_speed': {'value': 0.750, 'units': 'deg/s'},
+                          'number_of_darks': {'value': 10},
+                          'number_of_whites': {'value': 10},
+                          'mode': {'value': 'fly-scan'}},
+    'detector': {'name': {'value': 'PCO edge'},
+                 'exposure_time': {'value': 0.0001},
+                 'shutter_mode': {'value': 'global'},
+                 'pixel_size_x': {'value': 0.65e-4, 'units': 'm'},
+                 'pixel_size_y': {'value': 0.65e-4, 'units': 'm'},
+                 'actual_pixel_size_x': {'value': 0.65, 'units': 'um'},
+                 'actual_pixel_size_y': {'value': 0.65, 'units': 'um'}},
+    'scintillator': {'name': {'value': 'LuAG'},
+                     'scintillating_thickness': {'value': 10, 'units': 'um'}},
+    'mirror': {'name': {'value': '2-BM-A mirror'},
+               'description': {'value': 'Pt coating'},
+               'angle': {'value': 2.657, 'units': 'rad'}},
+    'monochromator': {'name': {'value': '2-BM-A DMM'},
+                      'description': {'value': 'Double Multi-layer Monochromator'},
+                      'energy': {'value': 27.4, 'units': 'keV'}},
+    }
+
+
+def convert(data_index, fatigue_cycle, slab_size=16, chunks='projection', compression=None, mode='copy'):
+    """
+    Convert one fatigue cycle into a Data Exchange file.
+
+    slab_size is the number of projections copied at once: peak memory is
+    one slab, not the full stack. chunks and compression set the HDF5
+    layout of the projections, see dxconvert.create_dataset.
+
+    mode 'copy' copies projections, flats and darks into the new file;
+    'link' only writes the meta-data and points exchange/data,
+    data_white and data_dark at the proj_XXXX.hdf files, see
+    dxconvert.link_dataset; 'materialize' turns the links of an already
+    converted file into real copies.
+    """
 
-if __name__ == '__main__':
-
-   
-    sample_name = 'H14_7075PA_172HV_99NF'
-
-    data_index = 73
-    fatigue_cycle = '00750'
-
-    data_index = 76
-    fatigue_cycle = '01500'
-
-    data_index = 79
-    fatigue_cycle = '02000'
-
-    data_index = 82
-    fatigue_cycle = '02750'
-
-    data_index = 85
-    fatigue_cycle = '03500'
-
-    data_index = 88
-    fatigue_cycle = '04000'
-
-    data_index = 91
-    fatigue_cycle = '04500'
-
-    data_index = 94
-    fatigue_cycle = '05500'
-
-    data_index = 97
-    fatigue_cycle = '06500'
-
-    data_index = 100
-    fatigue_cycle = '07500'
-
-    data_index = 103
-    fatigue_cycle = '08500'
-
-    data_index = 106
-    fatigue_cycle = '10000'
-
-    data_index = 109
-    fatigue_cycle = '12000'
-
-    data_index = 112
-    fatigue_cycle = '13000'
-
-    data_index = 115
-    fatigue_cycle = '13100'
-
-    data_index = 118
-    fatigue_cycle = '13200'
-
-    data_index = 121
-    fatigue_cycle = '13300'
-    
-    data_index = 124
-    fatigue_cycle = '13400'
-    
-    data_index = 127
-    fatigue_cycle = '13800'
-    
-    data_index = 130
-    fatigue_cycle = '13900'
-
-    data_index = 133
-    fatigue_cycle = '14000'
-
-    data_index = 136
-    fatigue_cycle = '14100'
-
-    data_index = 139
-    fatigue_cycle = '14200'
-
-    data_index = 142
-    fatigue_cycle = '14300'
-
-    data_index = 145
-    fatigue_cycle = '14346'
-
-    sample_detector_distance = 60
-
-    attenuator_name = 'filter set in 2-BM-A'
-    attenuator_description = '1mm C + 1mm Glass'
-   
-    experiment_prosal = '41928'
-    experiment_activity = '104291'
-    experiment_title = '4D Dynamics of Stress Corrosion Cracking in High Performance Aluminum Alloy'
-
-    experimenter_name = 'Nikhilesh Chawla Group'
-    experimenter_role = 'PI'
-    experimenter_affiliation = 'Arizona State University'
-    experimenter_address = 'School for Engineering of Matter, Transport, and Energy (SEMTE), 501 E. Tyler Mall, ECG 303, Tempe, AZ 85287-6106'
-    experimenter_phone = '(480) 965-2402'
-    experimenter_email = 'Nikhilesh.Chawla@asu.edu'
-
-    instrument_name = '2-BM fast tomography'  
-    instrument_comment = '2-BM-A Experimental Station'  
-    
-    acquisition_setup_rotation_start_angle = 0
-    acquisition_setup_rotation_end_angle = 180
-    acquisition_setup_rotation_speed = 0.750
-
-    objective_name = 'Mitutoyo long-working'
-    objective_description = 'a nice objective'
-    objective_manufacturer = 'Mitutoyo'
-    objective_magnification = '10x'
-
-    detector_name = 'PCO edge'
-    detector_exposure_time = 0.0001
-    detector_shutter_mode = 'global'
-    detector_pixel_size_x = 0.65e-4
-    detector_pixel_size_y = 0.65e-4
-    detector_actual_pixel_size_x = 0.65
-    detector_actual_pixel_size_y = 0.65
-
-    acquisition_setup_number_of_projections = 1500
-    acquisition_setup_number_of_darks = 10
-    acquisition_setup_number_of_whites = 10
-    acquisition_setup_mode = 'fly-scan'
-    
-    scintillator_name = 'LuAG' 
-    scintillator_scintillating_thickness = 10
-
-    mirror_name = '2-BM-A mirror'
-    mirror_description = 'Pt coating'
-    mirror_angle = 2.657
-
-    monochromator_name = '2-BM-A DMM'
-    monochromator_description = 'Double Multi-layer Monochromator'
-    monochromator_energy = 27.4
-    monochromator_energy_units = 'keV'
-       
     # Set path to the micro-CT data to reconstruct.
     fname_proj = '/local/decarlo/data/tomobank/' + sample_name + '_' + fatigue_cycle + 'C' + '/' + 'proj_' + "{:04d}".format(data_index) + '.hdf'
     fname_flat = '/local/decarlo/data/tomobank/' + sample_name + '_' + fatigue_cycle + 'C' + '/' + 'proj_' + "{:04d}".format(data_index+1) + '.hdf'
@@ -163,22 +124,26 @@ if __name__ == '__main__':
     acquisition_start_date = dxreader.read_hdf5(fname_proj, '/file_creation_datetime')
     print (acquisition_start_date[0][0])
 
-    proj = dxreader.read_hdf5(fname_proj, proj_grp, dtype=None)
-    flat = dxreader.read_hdf5(fname_flat, flat_grp, dtype=None)
-    dark = dxreader.read_hdf5(fname_dark, dark_grp, dtype=None)
+    proj_shape, proj_dtype = dxconvert.dataset_shape(fname_proj, proj_grp)
+    flat_shape, flat_dtype = dxconvert.dataset_shape(fname_flat, flat_grp)
+    dark_shape, dark_dtype = dxconvert.dataset_shape(fname_dark, dark_grp)
         
-    theta = np.linspace(0., 180., proj.shape[0]+1)
+    theta = np.linspace(0., 180., proj_shape[0]+1)
     
-    number_of_projections = proj.shape[0]
-    detector_dimension_y = proj.shape[1]
-    detector_dimension_x = proj.shape[2]
+    number_of_projections = proj_shape[0]
+    detector_dimension_y = proj_shape[1]
+    detector_dimension_x = proj_shape[2]
     
-    print (proj.shape)
-    print (flat.shape)
-    print (dark.shape)
+    print (proj_shape)
+    print (flat_shape)
+    print (dark_shape)
     print (theta.shape)
 
 
+    if mode == 'materialize':
+        print ("Materialized: ", dxconvert.materialize(fname, slab_size, chunks=chunks, compression=compression))
+        return
+
     if (fname != None):
         if os.path.isfile(fname):
             print ("Data Exchange file already exists: ", fname)
@@ -188,72 +153,71 @@ if __name__ == '__main__':
             if not os.path.exists(dirPath):
                 os.makedirs(dirPath)
 
-            # Open DataExchange file
-            f = dx.File(fname, mode='w') 
-
-            # Write the Data Exchange HDF5 file.
-            f.add_entry(dx.Entry.sample( name={'value':sample_name}))
-            f.add_entry(dx.Entry.sample( fatigue_cycle={'value':fatigue_cycle}))
-            f.add_entry(dx.Entry.sample_stack_setup(sample_detector_distance={'value':sample_detector_distance, 'units':'mm'}))
-
-            f.add_entry(dx.Entry.attenuator( name={'value':attenuator_name}))
-            f.add_entry(dx.Entry.attenuator( description={'value':attenuator_description}))
-
-            f.add_entry(dx.Entry.experiment( proposal={'value':experiment_prosal}))
-            f.add_entry(dx.Entry.experiment( activity={'value':experiment_activity}))
-            f.add_entry(dx.Entry.experiment( title={'value':experiment_title}))
-
-            f.add_entry(dx.Entry.experimenter(name={'value':experimenter_name}))
-            f.add_entry(dx.Entry.experimenter(role={'value':experimenter_role}))
-            f.add_entry(dx.Entry.experimenter(affiliation={'value':experimenter_affiliation}))
-            f.add_entry(dx.Entry.experimenter(address={'value':experimenter_address}))
-            f.add_entry(dx.Entry.experimenter(phone={'value':experimenter_phone}))
-            f.add_entry(dx.Entry.experimenter(email={'value':experimenter_email}))
-
-            f.add_entry(dx.Entry.instrument(name={'value':instrument_name}))
-            f.add_entry(dx.Entry.instrument(comment={'value':instrument_comment}))
-
-            f.add_entry(dx.Entry.objective(name={'value':objective_name}))
-            f.add_entry(dx.Entry.objective(description={'value':objective_description}))
-            f.add_entry(dx.Entry.objective(manufacturer={'value':objective_manufacturer}))
-            f.add_entry(dx.Entry.objective(magnification={'value':objective_magnification}))
-    
-            f.add_entry(dx.Entry.acquisition_setup(rotation_start_angle={'value':acquisition_setup_rotation_start_angle, 'units':'deg'}))
-            f.add_entry(dx.Entry.acquisition_setup(rotation_end_angle={'value':acquisition_setup_rotation_end_angle, 'units':'deg'}))
-            f.add_entry(dx.Entry.acquisition_setup(rotation_speed={'value':acquisition_setup_rotation_speed, 'units':'deg/s'}))
-            f.add_entry(dx.Entry.acquisition_setup(number_of_projections={'value':number_of_projections}))
-
-            f.add_entry(dx.Entry.acquisition_setup(number_of_darks={'value':acquisition_setup_number_of_darks}))
-            f.add_entry(dx.Entry.acquisition_setup(number_of_whites={'value':acquisition_setup_number_of_whites}))
-            f.add_entry(dx.Entry.acquisition_setup(mode={'value':acquisition_setup_mode}))
-            f.add_entry(dx.Entry.acquisition(start_date={'value':acquisition_start_date}))
+            # Open the partial DataExchange file, resuming an interrupted conversion
+            f = dxconvert.open_partial(fname)
+
+            # Write the Data Exchange HDF5 file: the series template plus what changes per cycle.
+            dxconvert.write_metadata(f, dxconvert.merge_metadata(metadata, {
+                'sample': {'fatigue_cycle': {'value': fatigue_cycle}},
+                'acquisition_setup': {'number_of_projections': {'value': number_of_projections}},
+                'acquisition': {'start_date': {'value': acquisition_start_date}},
+                'detector': {'dimension_x': {'value': detector_dimension_x},
+                             'dimension_y': {'value': detector_dimension_y}},
+                }))
+
+            if mode == 'link':
+                # Point at the raw files: no data is copied.
+                dxconvert.link_dataset(f, 'data', fname_proj, proj_grp)
+                dxconvert.link_dataset(f, 'data_white', fname_flat, flat_grp)
+                dxconvert.link_dataset(f, 'data_dark', fname_dark, dark_grp)
+            else:
+                # Stream projections, flats and darks slab by slab into preallocated datasets,
+                # reading the three files concurrently while writing.
+                data = dxconvert.create_dataset(f, 'data', proj_shape, proj_dtype, chunks=chunks, compression=compression)
+                data_white = dxconvert.create_dataset(f, 'data_white', flat_shape, flat_dtype, chunks=chunks, compression=compression)
+                data_dark = dxconvert.create_dataset(f, 'data_dark', dark_shape, dark_dtype, chunks=chunks, compression=compression)
+                dxconvert.ingest([(fname_proj, proj_grp, data),
+                                  (fname_flat, flat_grp, data_white),
+                                  (fname_dark, dark_grp, data_dark)], slab_size)
+            f.add_entry(dx.Entry.data(theta={'value': theta, 'units':'degrees'}))
 
-            f.add_entry(dx.Entry.detector(name={'value':detector_name}))
-            f.add_entry(dx.Entry.detector(exposure_time={'value':detector_exposure_time}))
-            f.add_entry(dx.Entry.detector(shutter_mode={'value':detector_shutter_mode}))
-            f.add_entry(dx.Entry.detector(pixel_size_x={'value':detector_pixel_size_x, 'units':'m'}))
-            f.add_entry(dx.Entry.detector(pixel_size_y={'value':detector_pixel_size_y, 'units':'m'}))
-            f.add_entry(dx.Entry.detector(actual_pixel_size_x={'value':detector_actual_pixel_size_x, 'units':'um'}))
-            f.add_entry(dx.Entry.detector(actual_pixel_size_y={'value':detector_actual_pixel_size_y, 'units':'um'}))
-            f.add_entry(dx.Entry.detector(dimension_x={'value':detector_dimension_x}))
-            f.add_entry(dx.Entry.detector(dimension_y={'value':detector_dimension_y}))
+            dxconvert.finish(f, fname)
 
-            f.add_entry(dx.Entry.scintillator(name={'value':scintillator_name}))
-            f.add_entry(dx.Entry.scintillator(scintillating_thickness={'value':scintillator_scintillating_thickness, 'units':'um'}))
 
-            f.add_entry(dx.Entry.mirror( name={'value':mirror_name}))
-            f.add_entry(dx.Entry.mirror( description={'value':mirror_description}))
-            f.add_entry(dx.Entry.mirror( angle={'value':mirror_angle, 'units':'rad'}))
-            
-            f.add_entry(dx.Entry.monochromator( name={'value':monochromator_name}))
-            f.add_entry(dx.Entry.monochromator( description={'value':monochromator_description}))
-            f.add_entry(dx.Entry.monochromator( energy={'value':monochromator_energy, 'units':'keV'}))
+def read_manifest(fname):
+    """
+    Read (data_index, fatigue_cycle) pairs from a text file with one
+    whitespace separated pair per line; '#' starts a comment.
+    """
+    cycles = []
+    with open(fname) as fp:
+        for line in fp:
+            line = line.split('#')[0].split()
+            if line:
+                cycles.append((int(line[0]), line[1]))
+    return cycles
 
-            f.add_entry(dx.Entry.data(data={'value': proj, 'units':'counts'}))
-            f.add_entry(dx.Entry.data(data_white={'value': flat, 'units':'counts'}))
-            f.add_entry(dx.Entry.data(data_dark={'value': dark, 'units':'counts'}))
-            f.add_entry(dx.Entry.data(theta={'value': theta, 'units':'degrees'}))
 
-            f.close()
-    
+if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--manifest', default=None,
+                        help='file listing "data_index fatigue_cycle" pairs (default: the full series)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='number of cycles converted in parallel')
+    parser.add_argument('--io-slots', type=int, default=2,
+                        help='maximum number of concurrent slab reads/writes across workers')
+    parser.add_argument('--slab-size', type=int, default=16,
+                        help='number of projections copied at once')
+    parser.add_argument('--chunks', default='projection',
+                        help="HDF5 chunk layout: 'projection', 'sinogram' or 'balanced'")
+    parser.add_argument('--compression', default=None,
+                        help="None, 'lzf', 'gzip[:level]' or 'blosc[:codec]'")
+    parser.add_argument('--mode', default='copy', choices=['copy', 'link', 'materialize'],
+                        help="'copy' the data, 'link' to the raw files, or 'materialize' linked files")
+    args = parser.parse_args()
+
+    cycles = fatigue_cycles if args.manifest is None else read_manifest(args.manifest)
+    jobs = [(data_index, fatigue_cycle, args.slab_size, args.chunks, args.compression, args.mode) for data_index, fatigue_cycle in cycles]
+    failed = dxconvert.run_batch(convert, jobs, workers=args.workers, io_slots=args.io_slots)
+    sys.exit(1 if failed else 0)
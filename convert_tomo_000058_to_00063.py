@@ -12,6 +12,7 @@ import numpy as np
 import dxchange
 import dxchange.reader as dxreader
 import dxfile.dxtomo as dx
+import dxconvert
 
 if __name__ == '__main__':
 
@@ -115,22 +116,30 @@ if __name__ == '__main__':
     acquisition_start_date = dxreader.read_hdf5(fname_proj, '/file_creation_datetime')
     print (acquisition_start_date[0][0])
 
-    proj = dxreader.read_hdf5(fname_proj, proj_grp, dtype=None)
-    flat = dxreader.read_hdf5(fname_flat, flat_grp, dtype=None)
-    dark = dxreader.read_hdf5(fname_dark, dark_grp, dtype=None)
+    # Number of projections copied at once: peak memory is a few slabs, not the full stack.
+    slab_size = 16
+
+    proj_shape, proj_dtype = dxconvert.dataset_shape(fname_proj, proj_grp)
+    flat_shape, flat_dtype = dxconvert.dataset_shape(fname_flat, flat_grp)
+    dark_shape, dark_dtype = dxconvert.dataset_shape(fname_dark, dark_grp)
         
-    theta = np.linspace(0., 180., proj.shape[0]+1)
+    theta = np.linspace(0., 180., proj_shape[0]+1)
     
-    number_of_projections = proj.shape[0]
-    detector_dimension_y = proj.shape[1]
-    detector_dimension_x = proj.shape[2]
+    number_of_projections = proj_shape[0]
+    detector_dimension_y = proj_shape[1]
+    detector_dimension_x = proj_shape[2]
     
-    print (proj.shape)
-    print (flat.shape)
-    print (dark.shape)
+    print (proj_shape)
+    print (flat_shape)
+    print (dark_shape)
     print (theta.shape)
 
 
+    # HDF5 layout of the projections: 'projection', 'sinogram' or 'balanced' chunks,
+    # None, 'lzf', 'gzip[:level]' or 'blosc[:codec]' compression.
+    chunks = 'projection'
+    compression = None
+
     if (fname != None):
         if os.path.isfile(fname):
             print ("Data Exchange file already exists: ", fname)
@@ -140,8 +149,8 @@ if __name__ == '__main__':
             if not os.path.exists(dirPath):
                 os.makedirs(dirPath)
 
-            # Open DataExchange file
-            f = dx.File(fname, mode='w') 
+            # Open the partial DataExchange file, resuming an interrupted conversion
+            f = dxconvert.open_partial(fname)
 
             # Write the Data Exchange HDF5 file.
             f.add_entry(dx.Entry.sample( name={'value':sample_name}))
@@ -201,11 +210,16 @@ if __name__ == '__main__':
             f.add_entry(dx.Entry.monochromator( description={'value':monochromator_description}))
             f.add_entry(dx.Entry.monochromator( energy={'value':monochromator_energy, 'units':'keV'}))
 
-            f.add_entry(dx.Entry.data(data={'value': proj, 'units':'counts'}))
-            f.add_entry(dx.Entry.data(data_white={'value': flat, 'units':'counts'}))
-            f.add_entry(dx.Entry.data(data_dark={'value': dark, 'units':'counts'}))
+            # Stream projections, flats and darks slab by slab into preallocated datasets,
+            # reading the three files concurrently while writing.
+            data = dxconvert.create_dataset(f, 'data', proj_shape, proj_dtype, chunks=chunks, compression=compression)
+            data_white = dxconvert.create_dataset(f, 'data_white', flat_shape, flat_dtype, chunks=chunks, compression=compression)
+            data_dark = dxconvert.create_dataset(f, 'data_dark', dark_shape, dark_dtype, chunks=chunks, compression=compression)
+            dxconvert.ingest([(fname_proj, proj_grp, data),
+                              (fname_flat, flat_grp, data_white),
+                              (fname_dark, dark_grp, data_dark)], slab_size)
             f.add_entry(dx.Entry.data(theta={'value': theta, 'units':'degrees'}))
 
-            f.close()
+            dxconvert.finish(f, fname)
     
 
@@ -12,6 +12,7 @@ import numpy as np
 import tomopy
 import dxchange
 import dxfile.dxtomo as dx
+import dxconvert
 
 if __name__ == '__main__':
 
@@ -51,21 +52,27 @@ if __name__ == '__main__':
     angular_step_unit = 'deg'
     
 
-    # Read the Elettra raw data.
-    sino, sflat, sdark, th = dxchange.read_aps_32id(fname)
+    # The Elettra raw data are in sinogram order: (rows, projections, columns).
+    fname_native = fname
+    sino_shape, sino_dtype = dxconvert.dataset_shape(fname_native, '/exchange/data')
+    sflat_shape, sflat_dtype = dxconvert.dataset_shape(fname_native, '/exchange/data_white')
+    sdark_shape, sdark_dtype = dxconvert.dataset_shape(fname_native, '/exchange/data_dark')
 
-    proj = np.swapaxes(sino,0,1)
-    flat = np.swapaxes(sflat,0,1)
-    dark = np.swapaxes(sdark,0,1)
+    proj_shape = (sino_shape[1], sino_shape[0], sino_shape[2])
+    flat_shape = (sflat_shape[1], sflat_shape[0], sflat_shape[2])
+    dark_shape = (sdark_shape[1], sdark_shape[0], sdark_shape[2])
 
-    # Set data collection angles as equally spaced between 0-180 degrees.
-    theta = tomopy.angles(proj.shape[0], ang1=0.0, ang2=180.0)
+    # Number of detector rows transposed at once.
+    block = 32
+
+    # Compression of the projections: None, 'lzf', 'gzip[:level]' or 'blosc[:codec]'.
+    compression = None
 
     # Set data collection angles as equally spaced between 0-180 degrees.
-    theta = np.linspace(0, 180, proj.shape[0])
+    theta = np.linspace(0, 180, proj_shape[0])
     theta = np.round(theta + 0.005, 2)
        
-    print (proj.shape, flat.shape, dark.shape, theta.shape)
+    print (proj_shape, flat_shape, dark_shape, theta.shape)
 
     # Convert into a data-exchange file.
     fname = '/local/dataraid/tomobank/' + tomobank_id + '/' + tomobank_id + '.h5'
@@ -78,8 +85,8 @@ if __name__ == '__main__':
             if not os.path.exists(dirPath):
                 os.makedirs(dirPath)
 
-            # Open DataExchange file
-            f = dx.File(fname, mode='w') 
+            # Open the partial DataExchange file, resuming an interrupted conversion
+            f = dxconvert.open_partial(fname)
 
             # Write the Data Exchange HDF5 file.
             f.add_entry(dx.Entry.experimenter(name={'value': experimenter_name}))
@@ -97,9 +104,13 @@ if __name__ == '__main__':
             f.add_entry(dx.Entry.source(energy={'value':source_energy, 'units':'GeV'}))
             f.add_entry(dx.Entry.sample_stack_setup(detector_distance={'value':sample_detector_distance, 'units':'mm'}))
 
-            f.add_entry(dx.Entry.data(data={'value': proj, 'units':'counts'}))
-            f.add_entry(dx.Entry.data(data_white={'value': flat, 'units':'counts'}))
-            f.add_entry(dx.Entry.data(data_dark={'value': dark, 'units':'counts'}))
+            # Transpose into projection order block by block while writing.
+            data = dxconvert.create_dataset(f, 'data', proj_shape, sino_dtype, chunks=dxconvert.transposed_chunks(sino_shape, block), compression=compression)
+            dxconvert.copy_transposed(fname_native, '/exchange/data', data, block)
+            data_white = dxconvert.create_dataset(f, 'data_white', flat_shape, sflat_dtype, chunks=dxconvert.transposed_chunks(sflat_shape, block), compression=compression)
+            dxconvert.copy_transposed(fname_native, '/exchange/data_white', data_white, block)
+            data_dark = dxconvert.create_dataset(f, 'data_dark', dark_shape, sdark_dtype, chunks=dxconvert.transposed_chunks(sdark_shape, block), compression=compression)
+            dxconvert.copy_transposed(fname_native, '/exchange/data_dark', data_dark, block)
             f.add_entry(dx.Entry.data(theta={'value': theta, 'units':'degrees'}))
 
             f.add_entry(dx.Entry.acquisition(start_date={'value': start_date}))
@@ -109,7 +120,7 @@ if __name__ == '__main__':
             f.add_entry(dx.Entry.acquisition(rotation_end_angle={'value': end_angle, 'unit': end_angle_unit}))
             f.add_entry(dx.Entry.acquisition(angular_step={'value': angular_step, 'unit': angular_step_unit}))
 
-            f.close()
+            dxconvert.finish(f, fname)
  
     else:
            print ("Nothing to do ...")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Checksums of the datasets of Data Exchange files
+"""
+
+from __future__ import print_function
+
+import os
+import json
+import hashlib
+import binascii
+
+import numpy as np
+
+__all__ = ['algorithm',
+           'digest_size',
+           'entry_digests',
+           'combine',
+           'to_hex',
+           'from_hex',
+           'sidecar_name',
+           'write_sidecar',
+           'read_sidecar']
+
+# blake2b is in hashlib from python 3.6 on.
+if hasattr(hashlib, 'blake2b'):
+    algorithm = 'blake2b-128'
+    digest_size = 16
+
+    def _new_hash():
+        return hashlib.blake2b(digest_size=digest_size)
+else:
+    algorithm = 'sha1'
+    digest_size = 20
+
+    def _new_hash():
+        return hashlib.sha1()
+
+
+def entry_digests(data):
+    """
+    Digest of each entry along the first axis of data, e.g. of each
+    projection of a (projections, rows, columns) stack.
+
+    Parameters
+    ----------
+    data : ndarray
+        Array holding one or more entries.
+
+    Returns
+    -------
+    ndarray
+        (entries, digest_size) uint8 array.
+    """
+    digests = np.empty((data.shape[0], digest_size), dtype=np.uint8)
+    for i in range(data.shape[0]):
+        h = _new_hash()
+        h.update(np.ascontiguousarray(data[i]))
+        digests[i] = np.frombuffer(h.digest(), dtype=np.uint8)
+    return digests
+
+
+def combine(digests):
+    """
+    Hex digest of a sequence of digests, e.g. of all the entries of a
+    dataset, or of all the datasets of a file.
+    """
+    h = _new_hash()
+    h.update(np.ascontiguousarray(digests, dtype=np.uint8))
+    return h.hexdigest()
+
+
+def to_hex(digests):
+    """
+    List of the hex strings of a (n, digest_size) array of digests.
+    """
+    return [binascii.hexlify(d.tobytes()).decode('ascii') for d in digests]
+
+
+def from_hex(strings):
+    """
+    (n, digest_size) uint8 array of a list of hex digests.
+    """
+    return np.array([bytearray(binascii.unhexlify(h)) for h in strings], dtype=np.uint8)
+
+
+def sidecar_name(fname):
+    """
+    Name of the checksum manifest of a Data Exchange file.
+    """
+    return fname + '.checksums.json'
+
+
+def write_sidecar(fname, desc):
+    """
+    Atomically write the checksum manifest desc of fname.
+    """
+    sidecar = sidecar_name(fname)
+    tmp = sidecar + '.tmp'
+    with open(tmp, 'w') as fp:
+        json.dump(desc, fp, indent=1, sort_keys=True)
+    os.rename(tmp, sidecar)
+
+
+def read_sidecar(fname):
+    """
+    Checksum manifest of fname, or None when there is none.
+    """
+    try:
+        with open(sidecar_name(fname)) as fp:
+            return json.load(fp)
+    except (IOError, OSError):
+        return None
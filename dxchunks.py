@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare HDF5 chunk layouts and compression filters on a Data Exchange file
+"""
+
+from __future__ import print_function
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+import h5py
+
+import dxconvert
+
+__all__ = ['compare_layouts']
+
+
+def _read_time(fname, read):
+    with h5py.File(fname, 'r') as f:
+        dset = f['/exchange/data']
+        t = time.time()
+        read(dset)
+        return time.time() - t
+
+
+def compare_layouts(fname, layouts, filters, rows=64, nread=8, slab_size=16):
+    """
+    Write a band of exchange/data rows with every chunk layout and
+    compression filter and measure compression ratio, write speed and
+    projection and sinogram read speed.
+
+    The sample is written as the converters write, slab_size projections
+    at a time into a partial file with checksums and checkpoints, see
+    dxconvert.ingest, so that write speeds include the cost of layouts
+    whose chunks span many projections.
+
+    The sample is read back right after being written, so read speeds
+    mostly measure chunk selection and decoding rather than the disk.
+
+    Parameters
+    ----------
+    fname : str
+        Data Exchange file.
+    layouts : list of str
+        Chunk layouts, see dxconvert.chunk_shape.
+    filters : list of str
+        Compression filters, see dxconvert.filter_options; None for none.
+    rows : int
+        Number of detector rows, from the middle of the detector, used as
+        sample. All projections are kept.
+    nread : int
+        Number of projections and of sinograms read back.
+    slab_size : int
+        Number of projections per write.
+
+    Returns
+    -------
+    list of dict
+        One entry per layout and filter.
+    """
+    with h5py.File(fname, 'r') as f:
+        dset = f['/exchange/data']
+        nproj, nrow, ncol = dset.shape
+        r0 = max(0, nrow // 2 - rows // 2)
+        sample = dset[:, r0:r0 + rows, :]
+    nbytes = sample.nbytes
+    nproj, nrow, ncol = sample.shape
+    projs = np.linspace(0, nproj - 1, nread).astype(int)
+    sinos = np.linspace(0, nrow - 1, min(nread, nrow)).astype(int)
+
+    def read_projections(dset):
+        for i in projs:
+            dset[i]
+
+    def read_sinograms(dset):
+        for i in sinos:
+            dset[:, i]
+
+    results = []
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for layout in layouts:
+            for compression in filters:
+                out = os.path.join(tmpdir, 'sample.h5' + dxconvert.partial_suffix)
+                t = time.time()
+                with h5py.File(out, 'w') as f:
+                    dset = dxconvert.create_dataset(f, 'data', sample.shape, sample.dtype,
+                                                    chunks=layout, compression=compression)
+                    for start in range(0, nproj, slab_size):
+                        end = min(start + slab_size, nproj)
+                        dset.write_direct(sample, np.s_[start:end], np.s_[start:end])
+                        dxconvert.checkpoint(dset, end, sample[start:end])
+                    del dset
+                write = time.time() - t
+                size = os.path.getsize(out)
+                proj_read = _read_time(out, read_projections)
+                sino_read = _read_time(out, read_sinograms)
+                os.remove(out)
+                results.append({'layout': layout,
+                                'compression': compression,
+                                'ratio': nbytes / float(size),
+                                'write': nbytes / 1e6 / max(write, 1e-9),
+                                'proj_read': len(projs) * nrow * ncol * sample.itemsize / 1e6 / max(proj_read, 1e-9),
+                                'sino_read': len(sinos) * nproj * ncol * sample.itemsize / 1e6 / max(sino_read, 1e-9)})
+    finally:
+        shutil.rmtree(tmpdir)
+    return results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('fname', help='Data Exchange file')
+    parser.add_argument('--layouts', default='projection,sinogram,balanced',
+                        help='comma separated chunk layouts')
+    parser.add_argument('--filters', default='none,lzf,gzip:1,gzip:4',
+                        help="comma separated compression filters, 'none' for no compression")
+    parser.add_argument('--rows', type=int, default=64, help='detector rows used as sample')
+    parser.add_argument('--slab-size', type=int, default=16, help='projections per write')
+    args = parser.parse_args()
+
+    filters = [None if c == 'none' else c for c in args.filters.split(',')]
+    results = compare_layouts(args.fname, args.layouts.split(','), filters, rows=args.rows,
+                               slab_size=args.slab_size)
+
+    print ("{:12s} {:12s} {:>7s} {:>12s} {:>12s} {:>12s}".format('layout', 'compression', 'ratio', 'write MB/s', 'proj MB/s', 'sino MB/s'))
+    for r in results:
+        print ("{:12s} {:12s} {:7.2f} {:12.1f} {:12.1f} {:12.1f}".format(r['layout'], str(r['compression']), r['ratio'], r['write'], r['proj_read'], r['sino_read']))
@@ -0,0 +1,863 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Helpers to stream raw data into Data Exchange files without loading whole volumes in memory
+"""
+
+from __future__ import print_function
+
+import os
+import threading
+import contextlib
+import multiprocessing
+import traceback
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    string_types = (basestring,)
+except NameError:
+    string_types = (str,)
+
+import numpy as np
+import h5py
+import dxfile.dxtomo as dx
+
+import dxchecksum
+
+__all__ = ['dataset_shape',
+           'chunk_shape',
+           'filter_options',
+           'open_partial',
+           'finish',
+           'resume_point',
+           'tracked',
+           'checkpoint',
+           'create_dataset',
+           'write_data',
+           'merge_metadata',
+           'write_metadata',
+           'link_dataset',
+           'materialize',
+           'ingest',
+           'open_source',
+           'copy_transposed',
+           'transpose_tiles',
+           'transposed_chunks',
+           'io_throttle',
+           'run_batch']
+
+# Semaphore shared by the batch workers to limit concurrent slab I/O.
+_io_slots = None
+
+# Conversions are written to fname + partial_suffix and renamed when complete.
+partial_suffix = '.part'
+
+# Largest chunk cache of a dataset written by create_dataset, in bytes.
+chunk_cache_bytes = 1024 ** 3
+
+
+def dataset_shape(fname, dataset):
+    """
+    Return shape and dtype of a dataset stored in an HDF5 file.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the HDF5 file.
+    dataset : str
+        Path to the dataset inside the file.
+
+    Returns
+    -------
+    tuple
+        (shape, dtype) of the dataset.
+    """
+    with h5py.File(fname, 'r') as f:
+        return f[dataset].shape, f[dataset].dtype
+
+
+def chunk_shape(shape, itemsize, layout='projection', chunk_bytes=4 * 1024 ** 2):
+    """
+    HDF5 chunk shape of a (projections, rows, columns) dataset.
+
+    Parameters
+    ----------
+    shape : tuple
+        Dataset shape.
+    itemsize : int
+        Bytes per element.
+    layout : str or tuple
+        'projection': one projection per chunk, fast projection reads.
+        'sinogram': a band of rows across all projections, fast sinogram
+        reads. 'balanced': full columns and the same number of
+        projections and rows, see dxtranspose. A tuple is returned as is.
+    chunk_bytes : int
+        Target chunk size of the 'sinogram' and 'balanced' layouts.
+
+    Returns
+    -------
+    tuple
+        Chunk shape.
+    """
+    if not isinstance(layout, string_types):
+        return tuple(layout)
+    n0, n1, n2 = shape
+    if layout == 'projection':
+        return (1, n1, n2)
+    if layout == 'sinogram':
+        band = chunk_bytes // (n0 * n2 * itemsize)
+        return (n0, max(1, min(band, n1)), n2)
+    if layout == 'balanced':
+        side = int(np.sqrt(max(1, chunk_bytes // (n2 * itemsize))))
+        return (max(1, min(side, n0)), max(1, min(side, n1)), n2)
+    raise ValueError('unknown chunk layout: {}'.format(layout))
+
+
+def filter_options(compression=None):
+    """
+    h5py keyword arguments of a lossless compression filter.
+
+    Parameters
+    ----------
+    compression : str, optional
+        None, 'lzf', 'gzip' or 'gzip:<level>', 'blosc' or
+        'blosc:<codec>' (lz4, lz4hc, zstd, zlib); blosc needs the
+        hdf5plugin package. All filters but None are preceded by the
+        byte shuffle filter.
+
+    Returns
+    -------
+    dict
+        Arguments for h5py create_dataset.
+    """
+    if compression is None:
+        return {}
+    name, _, opt = compression.partition(':')
+    if name == 'lzf':
+        return {'compression': 'lzf', 'shuffle': True}
+    if name == 'gzip':
+        return {'compression': 'gzip', 'compression_opts': int(opt or 4), 'shuffle': True}
+    if name == 'blosc':
+        try:
+            import hdf5plugin
+        except ImportError:
+            raise ValueError('blosc compression needs the hdf5plugin package')
+        # The blosc shuffle replaces the HDF5 one.
+        return dict(hdf5plugin.Blosc(cname=opt or 'lz4', clevel=5, shuffle=hdf5plugin.Blosc.SHUFFLE))
+    raise ValueError('unknown compression: {}'.format(compression))
+
+
+def open_partial(fname, resume=True):
+    """
+    Open the partial file of a conversion into fname for writing.
+
+    Data are written to fname + partial_suffix, which finish renames to
+    fname once complete, so fname only ever exists complete. The writers
+    of this module record in the 'progress' attribute of each exchange
+    dataset of a partial file how many entries along its first axis are
+    safely on disk. When a partial file is left by an interrupted
+    conversion it is reopened: those datasets are kept, so create_dataset
+    returns them and the writers restart from their last checkpoint,
+    while everything else, meta-data included, is dropped to be written
+    again. A partial file that HDF5 cannot open is started over.
+
+    The writers also store the digest of every entry they write under
+    /checksums, see finish and dxchecksum.
+
+    Parameters
+    ----------
+    fname : str
+        Final Data Exchange file name.
+    resume : bool
+        Resume an existing partial file rather than starting over.
+
+    Returns
+    -------
+    dxfile.dxtomo.File
+        The partial file open for writing.
+    """
+    part = fname + partial_suffix
+    if resume and os.path.isfile(part):
+        try:
+            f = dx.File(part, mode='a')
+        except (IOError, OSError):
+            print ("Cannot resume, starting over: ", part)
+        else:
+            for name in list(f):
+                if name not in ('exchange', 'checksums'):
+                    del f[name]
+            grp = f.require_group('exchange')
+            for name in list(grp):
+                if not (isinstance(grp[name], h5py.Dataset) and 'progress' in grp[name].attrs):
+                    del grp[name]
+            if 'checksums' in f:
+                for name in list(f['checksums']):
+                    if name not in grp:
+                        del f['checksums'][name]
+            print ("Resuming: ", part)
+            return f
+    return dx.File(part, mode='w')
+
+
+def finish(f, fname, slab_size=16):
+    """
+    Close the partial file f of a conversion and rename it to fname.
+
+    The digests of the entries written by the writers of this module are
+    completed, reading back the entries they could not hash inline (e.g.
+    after a resume or a transpose), and combined into one digest per
+    dataset and one per file. All of them are stored under /checksums
+    and in the sidecar manifest of fname, see dxverify.
+    """
+    grp = f.require_group('exchange')
+    datasets = {}
+    for name in grp:
+        dset = grp[name]
+        if isinstance(dset, h5py.Dataset) and 'progress' in dset.attrs:
+            del dset.attrs['progress']
+            if 'checksums' in f and name in f['checksums']:
+                datasets[name] = _complete_checksums(dset, f['checksums'][name], slab_size)
+    if datasets:
+        sums = f['checksums']
+        names = sorted(datasets)
+        sums.attrs['algorithm'] = dxchecksum.algorithm
+        sums.attrs['digest'] = dxchecksum.combine(dxchecksum.from_hex([datasets[name]['digest'] for name in names]))
+        dxchecksum.write_sidecar(fname, {'file': os.path.basename(fname),
+                                         'algorithm': dxchecksum.algorithm,
+                                         'digest': sums.attrs['digest'],
+                                         'datasets': datasets})
+    part = f.filename
+    f.close()
+    os.rename(part, fname)
+
+
+def _complete_checksums(dset, sums, slab_size):
+    # Entries never hashed have an all zero digest.
+    digests = sums[...]
+    if not digests.any(axis=1).all():
+        for start in range(0, dset.shape[0], slab_size):
+            end = min(start + slab_size, dset.shape[0])
+            if not digests[start:end].any(axis=1).all():
+                digests[start:end] = dxchecksum.entry_digests(dset[start:end])
+        sums[...] = digests
+    digest = dxchecksum.combine(digests)
+    sums.attrs['algorithm'] = dxchecksum.algorithm
+    sums.attrs['digest'] = digest
+    return {'shape': list(dset.shape),
+            'dtype': str(dset.dtype),
+            'chunks': list(dset.chunks) if dset.chunks else None,
+            'digest': digest,
+            'entries': dxchecksum.to_hex(digests)}
+
+
+def resume_point(dst):
+    """
+    Number of entries along the first axis of dst already written by an
+    interrupted conversion, see open_partial.
+    """
+    return int(dst.attrs.get('progress', 0))
+
+
+def tracked(dst):
+    """
+    Whether dst is a dataset of a partial file, whose progress and
+    checksums are recorded by checkpoint.
+    """
+    return 'progress' in dst.attrs
+
+
+def checkpoint(dst, end, data=None, digests=None):
+    """
+    Record that the first end entries of dst are written and flush the
+    file. Does nothing on datasets that are not in a partial file.
+
+    Progress is only recorded, and the file flushed, at the end of a row
+    of chunks along the first axis, or of dst: flushing writes, and
+    compresses, every chunk cached so far, so flushing partly written
+    chunks after each slab would write them again and again. Digests are
+    stored on every call.
+
+    Parameters
+    ----------
+    dst : h5py.Dataset
+        Dataset being written.
+    end : int
+        Number of entries along the first axis written so far.
+    data : ndarray, optional
+        The last entries written, hashed into the checksums of dst.
+    digests : ndarray, optional
+        Their digests, when already computed, see dxchecksum.entry_digests.
+    """
+    if not tracked(dst):
+        return
+    if digests is None and data is not None:
+        digests = dxchecksum.entry_digests(data)
+    if digests is not None:
+        sums = dst.file['checksums'][dst.name.split('/')[-1]]
+        sums[end - len(digests):end] = digests
+    if dst.chunks is None or end % dst.chunks[0] == 0 or end == dst.shape[0]:
+        dst.attrs['progress'] = end
+        dst.file.flush()
+
+
+def _chunk_row_bytes(dset):
+    # Bytes of the chunks sharing a position along the first axis, which
+    # a slab of entries writes together.
+    nbytes = int(np.prod(dset.chunks)) * dset.dtype.itemsize
+    for n, c in zip(dset.shape[1:], dset.chunks[1:]):
+        nbytes *= -(-n // c)
+    return nbytes
+
+
+def _open_cached(grp, name):
+    """
+    Open grp[name] with a chunk cache holding a whole row of chunks,
+    up to chunk_cache_bytes, so that the slabs written into a chunk stay
+    in memory until it is complete and it is compressed and written once.
+    """
+    dset = grp[name]
+    if dset.chunks is None:
+        return dset
+    nbytes = _chunk_row_bytes(dset)
+    if nbytes > chunk_cache_bytes:
+        print ("Warning: a row of chunks does not fit in the chunk cache, slabs rewrite chunks: ", dset.name)
+        nbytes = chunk_cache_bytes
+    nchunks = nbytes // (int(np.prod(dset.chunks)) * dset.dtype.itemsize) + 1
+    # The cache is set when a dataset is opened, so close it first.
+    del dset
+    dapl = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+    dapl.set_chunk_cache(10 * nchunks + 1, max(nbytes, 1024 ** 2), 1.0)
+    return h5py.Dataset(h5py.h5d.open(grp.id, name if isinstance(name, bytes) else name.encode('utf-8'), dapl))
+
+
+def create_dataset(f, name, shape, dtype, units='counts', chunks=None, compression=None):
+    """
+    Preallocate a chunked dataset under the exchange group of an open
+    Data Exchange file.
+
+    Parameters
+    ----------
+    f : dxfile.dxtomo.File
+        Data Exchange file open for writing.
+    name : str
+        Dataset name, e.g. 'data', 'data_white' or 'data_dark'.
+    shape : tuple
+        Dataset shape (projections, rows, columns).
+    dtype : numpy.dtype
+        Dataset type.
+    units : str
+        Value stored in the units attribute.
+    chunks : str or tuple, optional
+        Chunk layout or shape, see chunk_shape. Defaults to one
+        projection per chunk.
+    compression : str, optional
+        Compression filter, see filter_options.
+
+    Returns
+    -------
+    h5py.Dataset
+        The preallocated dataset, or the one left with the same shape and
+        type by an interrupted conversion, see open_partial. It is open
+        with a chunk cache holding a row of chunks along the first axis,
+        up to chunk_cache_bytes, so that slabs written into chunks
+        spanning many projections do not rewrite them.
+    """
+    if chunks is None:
+        chunks = 'projection'
+    chunks = chunk_shape(shape, np.dtype(dtype).itemsize, chunks)
+    grp = f.require_group('exchange')
+    if name in grp:
+        dset = grp[name]
+        if 'progress' in dset.attrs and dset.shape == tuple(shape) and dset.dtype == np.dtype(dtype):
+            del dset
+            return _open_cached(grp, name)
+        del grp[name]
+    dset = grp.create_dataset(name, shape=shape, dtype=dtype, chunks=chunks,
+                              **filter_options(compression))
+    dset.attrs['units'] = units
+    if f.filename.endswith(partial_suffix):
+        dset.attrs['progress'] = 0
+        sums = f.require_group('checksums')
+        if name in sums:
+            del sums[name]
+        sums.create_dataset(name, shape=(shape[0], dxchecksum.digest_size), dtype=np.uint8)
+    del dset
+    return _open_cached(grp, name)
+
+
+def write_data(f, proj, flat, dark, theta, chunks=None, compression=None):
+    """
+    Write in memory projections, flat and dark fields and angles into the
+    exchange group as chunked, optionally compressed datasets.
+
+    Parameters
+    ----------
+    f : dxfile.dxtomo.File
+        Data Exchange file open for writing.
+    proj, flat, dark : ndarray
+        Projections, flat and dark fields.
+    theta : ndarray
+        Projection angles in degrees.
+    chunks : str or tuple, optional
+        Chunk layout or shape, see chunk_shape.
+    compression : str, optional
+        Compression filter, see filter_options.
+    """
+    for name, value in (('data', proj), ('data_white', flat), ('data_dark', dark)):
+        value = np.asarray(value)
+        dset = create_dataset(f, name, value.shape, value.dtype, chunks=chunks, compression=compression)
+        dset.write_direct(np.ascontiguousarray(value))
+        checkpoint(dset, value.shape[0], value)
+    f.add_entry(dx.Entry.data(theta={'value': theta, 'units':'degrees'}))
+
+
+def merge_metadata(template, *updates):
+    """
+    Merge meta-data descriptions, see write_metadata; later updates
+    override the fields of earlier ones, group by group.
+
+    Returns
+    -------
+    dict
+        A new description; template and updates are left unchanged.
+    """
+    meta = {}
+    for desc in (template,) + updates:
+        for group, fields in desc.items():
+            meta.setdefault(group, {}).update(fields)
+    return meta
+
+
+def write_metadata(f, meta):
+    """
+    Write a whole meta-data description into a Data Exchange file with a
+    single add_entry call.
+
+    Parameters
+    ----------
+    f : dxfile.dxtomo.File
+        Data Exchange file open for writing.
+    meta : dict
+        {group: {field: spec}} where group is a dx.Entry name, e.g.
+        'sample', 'detector' or 'monochromator', and spec is either
+        {'value': value, 'units': units} ('unit' is accepted too) or a
+        bare value. Fields whose
+        value is None are skipped.
+
+    Raises
+    ------
+    ValueError
+        On unknown groups or malformed fields; nothing is written then.
+    """
+    entries = []
+    for group in sorted(meta):
+        if not hasattr(dx.Entry, group):
+            raise ValueError('unknown Data Exchange group: {}'.format(group))
+        fields = {}
+        for field, spec in meta[group].items():
+            if not isinstance(spec, dict):
+                spec = {'value': spec}
+            if 'value' not in spec or set(spec) - set(['value', 'units', 'unit']):
+                raise ValueError('malformed field {}/{}: {}'.format(group, field, spec))
+            if spec['value'] is not None:
+                fields[field] = spec
+        if fields:
+            entries.append(getattr(dx.Entry, group)(**fields))
+    f.add_entry(entries)
+
+
+def link_dataset(f, name, fname, dataset, units='counts'):
+    """
+    Make exchange/<name> of an open Data Exchange file point at a dataset
+    of another HDF5 file instead of copying it.
+
+    A virtual dataset is used when h5py and HDF5 support it (h5py >= 2.9,
+    HDF5 >= 1.10), an external link otherwise. Either way no data is
+    copied; the source file must stay at the same place relative to f,
+    see materialize to turn the links into real datasets.
+
+    Parameters
+    ----------
+    f : dxfile.dxtomo.File
+        Data Exchange file open for writing.
+    name : str
+        Dataset name, e.g. 'data', 'data_white' or 'data_dark'.
+    fname : str
+        Path to the source HDF5 file.
+    dataset : str
+        Path to the source dataset.
+    units : str
+        Value stored in the units attribute of a virtual dataset.
+
+    Returns
+    -------
+    h5py.Dataset
+        The linked dataset.
+    """
+    grp = f.require_group('exchange')
+    # Stored relative to f, so that a series can be moved as a whole.
+    target = os.path.relpath(os.path.abspath(fname), os.path.dirname(os.path.abspath(f.filename)))
+    # A resumed partial file may hold the link of an interrupted run; the
+    # link itself is checked, a dangling one included.
+    if grp.get(name, getlink=True) is not None:
+        del grp[name]
+    if hasattr(h5py, 'VirtualLayout'):
+        shape, dtype = dataset_shape(fname, dataset)
+        layout = h5py.VirtualLayout(shape=shape, dtype=dtype)
+        layout[...] = h5py.VirtualSource(target, dataset, shape=shape)
+        dset = grp.create_virtual_dataset(name, layout)
+        dset.attrs['units'] = units
+    else:
+        grp[name] = h5py.ExternalLink(target, dataset)
+        dset = grp[name]
+    return dset
+
+
+def _link_source(fname, grp, name):
+    # File and dataset a link made by link_dataset points at, the file
+    # relative to the current directory.
+    link = grp.get(name, getlink=True)
+    if isinstance(link, h5py.ExternalLink):
+        target, dataset = link.filename, link.path
+    else:
+        sources = grp[name].virtual_sources()
+        if len(sources) != 1:
+            raise ValueError('not a single source virtual dataset: {}'.format(name))
+        target, dataset = sources[0].file_name, sources[0].dset_name
+    return os.path.join(os.path.dirname(os.path.abspath(fname)), target), dataset
+
+
+def materialize(fname, slab_size=16, chunks=None, compression=None):
+    """
+    Replace the virtual datasets and external links under the exchange
+    group of a Data Exchange file, see link_dataset, with real copies of
+    the data, slab_size projections at a time, see ingest.
+
+    Parameters
+    ----------
+    fname : str
+        Data Exchange file, modified in place.
+    slab_size : int
+        Number of projections copied per read/write.
+    chunks : str or tuple, optional
+        Chunk layout or shape of the copies, see chunk_shape.
+    compression : str, optional
+        Compression filter of the copies, see filter_options.
+
+    Returns
+    -------
+    list of str
+        Names of the materialized datasets.
+    """
+    done = []
+    with h5py.File(fname, 'r+') as f:
+        grp = f.require_group('exchange')
+        for name in list(grp):
+            link = grp.get(name, getlink=True)
+            src = grp[name]
+            if not isinstance(src, h5py.Dataset):
+                continue
+            if not (isinstance(link, h5py.ExternalLink) or getattr(src, 'is_virtual', False)):
+                continue
+            attrs = dict(src.attrs)
+            shape, dtype = src.shape, src.dtype
+            del src
+            tmp = name + '.materialize'
+            if tmp in grp:
+                del grp[tmp]
+            dst = create_dataset(f, tmp, shape, dtype, chunks=chunks, compression=compression)
+            ingest([_link_source(fname, grp, name) + (dst,)], slab_size)
+            for key, value in attrs.items():
+                dst.attrs[key] = value
+            if 'units' not in attrs:
+                dst.attrs['units'] = 'counts'
+            del dst
+            del grp[name]
+            grp.move(tmp, name)
+            done.append(name)
+    return done
+
+
+def _slab_reader(fname, dataset, buffers, free, ready, tag, first=0, hashed=False):
+    """
+    Fill the free buffers with consecutive slabs of a dataset, from
+    projection first on, and post (tag, buffer index, start, end,
+    digests) on ready; digests are those of the projections of the slab
+    when hashed is set, None otherwise. (tag, None, None, error, None)
+    marks the end of the dataset.
+
+    Contiguous, uncompressed datasets are read with plain file reads at
+    the dataset offset, which run outside of the GIL and of the h5py
+    lock, so several readers and the writer really overlap.
+    """
+    try:
+        with h5py.File(fname, 'r') as f:
+            src = f[dataset]
+            offset = None
+            if src.chunks is None and src.compression is None:
+                offset = src.id.get_offset()
+            nproj = src.shape[0]
+            frame = int(np.prod(src.shape[1:])) * src.dtype.itemsize
+            slab_size = buffers[0].shape[0]
+            fp = open(fname, 'rb', buffering=0) if offset is not None else None
+            try:
+                for start in range(first, nproj, slab_size):
+                    end = min(start + slab_size, nproj)
+                    n = end - start
+                    idx = free.get()
+                    buf = buffers[idx]
+                    with io_throttle():
+                        if fp is not None:
+                            fp.seek(offset + start * frame)
+                            view = memoryview(buf[:n].reshape(-1).view('u1'))
+                            while view.nbytes:
+                                nread = fp.readinto(view)
+                                if not nread:
+                                    raise IOError('unexpected end of file: {}'.format(fname))
+                                view = view[nread:]
+                        else:
+                            src.read_direct(buf, np.s_[start:end], np.s_[0:n])
+                    digests = dxchecksum.entry_digests(buf[:n]) if hashed else None
+                    ready.put((tag, idx, start, end, digests))
+            finally:
+                if fp is not None:
+                    fp.close()
+        ready.put((tag, None, None, None, None))
+    except Exception:
+        ready.put((tag, None, None, traceback.format_exc(), None))
+
+
+def ingest(jobs, slab_size=16, nbuf=2):
+    """
+    Copy several HDF5 datasets, e.g. projections, flat and dark fields
+    stored in separate files, into their destinations concurrently.
+
+    Each source is read by its own thread into nbuf reusable slab
+    buffers while the calling thread writes the slabs that are ready, so
+    reads of all sources overlap with each other and with the writes and
+    memory stays at nbuf slabs per source.
+
+    Parameters
+    ----------
+    jobs : list of tuple
+        (fname, dataset, dst) of each copy; dst is a preallocated
+        h5py.Dataset with the shape of the source.
+    slab_size : int
+        Number of projections per slab.
+    nbuf : int
+        Buffers per source.
+
+    Copies into a partial file resume after the last checkpoint of each
+    destination, see open_partial; the readers hash the slabs for the
+    checksums of those files.
+    """
+    ready = queue.Queue()
+    readers = []
+    frees = []
+    buffers = []
+    for tag, (fname, dataset, dst) in enumerate(jobs):
+        shape, dtype = dataset_shape(fname, dataset)
+        if shape != dst.shape:
+            raise ValueError('shape mismatch: {} != {}'.format(shape, dst.shape))
+        n = max(1, min(slab_size, shape[0]))
+        bufs = [np.empty((n,) + tuple(shape[1:]), dtype=dtype) for _ in range(nbuf)]
+        free = queue.Queue()
+        for idx in range(nbuf):
+            free.put(idx)
+        thread = threading.Thread(target=_slab_reader, args=(fname, dataset, bufs, free, ready, tag,
+                                                            resume_point(dst), tracked(dst)))
+        thread.daemon = True
+        readers.append(thread)
+        frees.append(free)
+        buffers.append(bufs)
+    for thread in readers:
+        thread.start()
+
+    running = len(jobs)
+    error = None
+    while running:
+        tag, idx, start, end, digests = ready.get()
+        if idx is None:
+            running -= 1
+            if end is not None and error is None:
+                error = end
+            continue
+        if error is None:
+            with io_throttle():
+                jobs[tag][2].write_direct(buffers[tag][idx], np.s_[0:end - start], np.s_[start:end])
+            # Slabs of a source arrive in order, so this is a valid checkpoint.
+            checkpoint(jobs[tag][2], end, digests=digests)
+        frees[tag].put(idx)
+    for thread in readers:
+        thread.join()
+    if error is not None:
+        raise IOError('reading failed:\n' + error)
+
+
+def open_source(f, dataset):
+    """
+    Return a read-only memory map of a contiguous, uncompressed HDF5
+    dataset, or the h5py dataset itself when it cannot be mapped.
+    """
+    dset = f[dataset]
+    if dset.chunks is None and dset.compression is None:
+        offset = dset.id.get_offset()
+        if offset is not None:
+            return np.memmap(f.filename, mode='r', dtype=dset.dtype,
+                             offset=offset, shape=dset.shape)
+    return dset
+
+
+def copy_transposed(fname, dataset, dst, block=32):
+    """
+    Copy a sinogram ordered dataset (rows, projections, columns) into a
+    projection ordered dst (projections, rows, columns), block rows at a
+    time.
+
+    Blocks are read through a memory map when the source is contiguous
+    and transposed straight into a reusable buffer that is written
+    without further copies; neither the full volume nor a swapped copy
+    of it is ever in memory. dst should be chunked with block rows per
+    chunk, see transposed_chunks, so that every write fills whole chunks.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the source HDF5 file.
+    dataset : str
+        Path to the source dataset.
+    dst : h5py.Dataset
+        Preallocated destination.
+    block : int
+        Number of detector rows copied at once.
+    """
+    with h5py.File(fname, 'r') as f:
+        src = open_source(f, dataset)
+        transpose_tiles(src, dst, (block, src.shape[1]))
+
+
+def transpose_tiles(src, dst, tile):
+    """
+    Write src (n0, n1, n2) into dst (n1, n0, n2) one tile of
+    tile[0] x tile[1] x n2 elements at a time.
+
+    Each tile is read, transposed into a single reusable buffer and
+    written without further copies, so memory stays at one tile whatever
+    the size of the volume. Tiles aligned with the chunks of dst make
+    every write fill whole chunks.
+
+    Parameters
+    ----------
+    src : array_like
+        Source, an h5py dataset or a memory map.
+    dst : h5py.Dataset
+        Preallocated destination.
+    tile : tuple
+        Tile size along the first two axes of src.
+
+    Returns
+    -------
+    int
+        Number of bytes copied.
+
+    Copies into a partial file resume after the last complete row of
+    tiles, see open_partial; progress counts entries along the first axis
+    of src.
+    """
+    n0, n1, n2 = src.shape
+    if dst.shape != (n1, n0, n2):
+        raise ValueError('shape mismatch: {} != {}'.format(dst.shape, (n1, n0, n2)))
+    t0 = max(1, min(tile[0], n0))
+    t1 = max(1, min(tile[1], n1))
+    buf = np.empty((t1, t0, n2), dtype=src.dtype)
+    for a0 in range(resume_point(dst), n0, t0):
+        a1 = min(a0 + t0, n0)
+        for b0 in range(0, n1, t1):
+            b1 = min(b0 + t1, n1)
+            with io_throttle():
+                np.copyto(buf[:b1 - b0, :a1 - a0], np.swapaxes(src[a0:a1, b0:b1], 0, 1))
+                dst.write_direct(buf, np.s_[0:b1 - b0, 0:a1 - a0], np.s_[b0:b1, a0:a1])
+        checkpoint(dst, a1)
+    return n0 * n1 * n2 * np.dtype(src.dtype).itemsize
+
+
+def transposed_chunks(shape, block=32):
+    """
+    Chunk shape of the projection ordered copy of a sinogram ordered
+    dataset of the given shape, matching the blocks of copy_transposed.
+    """
+    nrow, nproj, ncol = shape
+    return (1, min(block, nrow), ncol)
+
+
+@contextlib.contextmanager
+def io_throttle():
+    """
+    Hold one of the I/O slots shared by the run_batch workers, if any.
+    """
+    if _io_slots is None:
+        yield
+    else:
+        with _io_slots:
+            yield
+
+
+def _init_worker(io_slots):
+    global _io_slots
+    _io_slots = io_slots
+
+
+def _run_job(func, job):
+    try:
+        func(*job)
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def run_batch(func, jobs, workers=None, io_slots=None):
+    """
+    Run func(*job) for every job in a pool of worker processes.
+
+    Parameters
+    ----------
+    func : callable
+        Module level function converting one dataset.
+    jobs : list of tuple
+        Positional arguments of each call.
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs.
+    io_slots : int, optional
+        Maximum number of slabs read/written at the same time across all
+        workers. None leaves I/O unthrottled.
+
+    Returns
+    -------
+    list of tuple
+        The jobs that failed, each paired with its traceback.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = max(1, min(workers, len(jobs)))
+    sem = multiprocessing.Semaphore(io_slots) if io_slots else None
+    pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(sem,))
+    try:
+        results = [(job, pool.apply_async(_run_job, (func, job))) for job in jobs]
+        failed = []
+        for job, res in results:
+            error = res.get()
+            if error is not None:
+                print ("Conversion failed: ", job)
+                print (error)
+                failed.append((job, error))
+            else:
+                print ("Conversion done: ", job)
+    finally:
+        pool.close()
+        pool.join()
+    return failed
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Out-of-core transpose of a Data Exchange file between projection and sinogram order
+"""
+
+from __future__ import print_function
+
+import os
+import time
+import argparse
+
+import numpy as np
+import h5py
+
+import dxconvert
+
+__all__ = ['transpose_file']
+
+datasets = ['data', 'data_white', 'data_dark']
+
+# Axes labels of the two orders.
+axes_labels = {'theta:y:x': 'y:theta:x', 'y:theta:x': 'theta:y:x'}
+
+
+def transpose_file(src_fname, dst_fname, tile_bytes=256 * 1024 ** 2, chunk_bytes=4 * 1024 ** 2):
+    """
+    Write a copy of a Data Exchange file with the first two axes of
+    exchange/data, data_white and data_dark swapped.
+
+    The transposed datasets have balanced chunks: full detector columns
+    and the same number of entries along the first two axes, so reading
+    either projections or sinograms touches the same number of chunks.
+    The volumes are copied in tiles of about tile_bytes aligned with
+    those chunks; everything else in the file is copied as is.
+
+    Parameters
+    ----------
+    src_fname : str
+        Source Data Exchange file.
+    dst_fname : str
+        Transposed Data Exchange file.
+    tile_bytes : int
+        Memory used by one tile.
+    chunk_bytes : int
+        Target chunk size of the transposed datasets.
+
+    Returns
+    -------
+    dict
+        Bytes copied and seconds spent for each dataset.
+    """
+    report = {}
+    with h5py.File(src_fname, 'r', rdcc_nbytes=tile_bytes) as src, h5py.File(dst_fname, 'w') as dst:
+        for name, value in src.attrs.items():
+            dst.attrs[name] = value
+        for name in src:
+            if name != 'exchange':
+                src.copy(name, dst)
+        exchange = dst.require_group('exchange')
+        for name in src['exchange']:
+            if name not in datasets:
+                src.copy('exchange/' + name, exchange)
+        for name in datasets:
+            if name not in src['exchange']:
+                continue
+            dset = src['exchange'][name]
+            n0, n1, n2 = dset.shape
+            itemsize = dset.dtype.itemsize
+            chunks = dxconvert.chunk_shape((n1, n0, n2), itemsize, 'balanced', chunk_bytes)
+            out = exchange.create_dataset(name, shape=(n1, n0, n2), dtype=dset.dtype, chunks=chunks)
+            for key, value in dset.attrs.items():
+                out.attrs[key] = value
+            axes = dset.attrs.get('axes')
+            if isinstance(axes, bytes):
+                axes = axes.decode()
+            if axes in axes_labels:
+                out.attrs['axes'] = axes_labels[axes]
+
+            # Tiles are whole multiples of the destination chunks.
+            k = int(np.sqrt(max(1, tile_bytes // (chunks[0] * chunks[1] * n2 * itemsize))))
+            tile = (chunks[1] * k, chunks[0] * k)
+            t = time.time()
+            nbytes = dxconvert.transpose_tiles(dxconvert.open_source(src, 'exchange/' + name), out, tile)
+            report[name] = (nbytes, time.time() - t)
+    return report
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('src', help='Data Exchange file to transpose')
+    parser.add_argument('dst', help='transposed Data Exchange file')
+    parser.add_argument('--tile-mb', type=float, default=256, help='memory used by one tile in MB')
+    parser.add_argument('--chunk-mb', type=float, default=4, help='target chunk size in MB')
+    args = parser.parse_args()
+
+    if os.path.isfile(args.dst):
+        print ("Data Exchange file already exists: ", args.dst)
+    else:
+        report = transpose_file(args.src, args.dst,
+                                tile_bytes=int(args.tile_mb * 1024 ** 2),
+                                chunk_bytes=int(args.chunk_mb * 1024 ** 2))
+        total_bytes = total_time = 0
+        for name in datasets:
+            if name in report:
+                nbytes, seconds = report[name]
+                total_bytes += nbytes
+                total_time += seconds
+                print ("{:12s} {:10.1f} MB {:8.2f} s {:8.1f} MB/s".format(name, nbytes / 1e6, seconds, nbytes / 1e6 / max(seconds, 1e-9)))
+        print ("{:12s} {:10.1f} MB {:8.2f} s {:8.1f} MB/s".format('total', total_bytes / 1e6, total_time, total_bytes / 1e6 / max(total_time, 1e-9)))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Verify Data Exchange files against their checksum manifests
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import glob
+import argparse
+import multiprocessing
+
+import numpy as np
+import h5py
+
+import dxchecksum
+
+__all__ = ['verify_range',
+           'verify_files']
+
+
+def verify_range(fname, name, start, end, expected, block=16):
+    """
+    Hash entries start to end of exchange/<name> of fname, block entries
+    at a time, and return the indices of those that do not match the
+    expected hex digests, or an error message when the entries cannot be
+    read at all.
+    """
+    try:
+        with h5py.File(fname, 'r') as f:
+            dset = f['exchange'][name]
+            step = max(1, block)
+            digests = np.concatenate([dxchecksum.entry_digests(dset[i:min(i + step, end)])
+                                      for i in range(start, end, step)])
+    except Exception as err:
+        return fname, name, start, end, str(err)
+    bad = np.flatnonzero((digests != dxchecksum.from_hex(expected)).any(axis=1))
+    return fname, name, start, end, [start + int(i) for i in bad]
+
+
+def _verify_range(args):
+    return verify_range(*args)
+
+
+def _chunks_of(i, chunks, shape):
+    """
+    The HDF5 chunks holding entry i of a dataset, by their index along
+    each axis, e.g. 'chunks (3, 0-7, 0)' for a band of rows.
+    """
+    first = [i // chunks[0]] + [0] * (len(shape) - 1)
+    last = [i // chunks[0]] + [(n - 1) // c for n, c in zip(shape[1:], chunks[1:])]
+    index = ', '.join(str(a) if a == b else '{}-{}'.format(a, b) for a, b in zip(first, last))
+    return '{} ({})'.format('chunk' if first == last else 'chunks', index)
+
+
+def _describe(fname):
+    """
+    Checksum manifest of fname, or the checksums stored in the file when
+    the sidecar is missing; checks that both agree when both exist.
+    """
+    desc = dxchecksum.read_sidecar(fname)
+    problems = []
+    with h5py.File(fname, 'r') as f:
+        if 'checksums' not in f:
+            if desc is None:
+                problems.append('no checksums')
+            return desc, problems
+        sums = f['checksums']
+        stored = {}
+        for name in sums:
+            dset = f['exchange'][name]
+            stored[name] = {'shape': list(dset.shape),
+                            'chunks': list(dset.chunks) if dset.chunks else None,
+                            'digest': sums[name].attrs.get('digest'),
+                            'entries': dxchecksum.to_hex(sums[name][...])}
+        if desc is None:
+            desc = {'algorithm': sums.attrs.get('algorithm'), 'datasets': stored}
+        else:
+            for name, entry in desc['datasets'].items():
+                if name not in stored:
+                    problems.append('{}: missing dataset'.format(name))
+                elif stored[name]['digest'] != entry['digest'] or stored[name]['shape'] != entry['shape']:
+                    problems.append('{}: checksums in file differ from the manifest'.format(name))
+    if desc.get('algorithm') != dxchecksum.algorithm:
+        problems.append('checksums made with {}, only {} is available'.format(desc.get('algorithm'), dxchecksum.algorithm))
+        return None, problems
+    for name, entry in desc['datasets'].items():
+        if dxchecksum.combine(dxchecksum.from_hex(entry['entries'])) != entry['digest']:
+            problems.append('{}: manifest entries do not match their digest'.format(name))
+    return desc, problems
+
+
+def verify_files(fnames, workers=None, block=16):
+    """
+    Verify every entry of the checksummed datasets of Data Exchange files.
+
+    Files are split in ranges of block entries, aligned with the HDF5
+    chunks when these hold at most block entries, hashed by a pool of
+    worker processes, so that the disks rather than the hashing set the
+    pace and each worker holds block entries at most.
+
+    Parameters
+    ----------
+    fnames : list of str
+        Data Exchange files.
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs.
+    block : int
+        Number of entries hashed per task.
+
+    Returns
+    -------
+    dict
+        For each file, the list of its problems: corrupted entries with
+        the HDF5 chunks holding them, indexed along every axis,
+        unreadable ranges and manifest inconsistencies. Empty lists mean
+        the file verified.
+    """
+    report = {}
+    layout = {}
+    tasks = []
+    for fname in fnames:
+        try:
+            desc, report[fname] = _describe(fname)
+        except Exception as err:
+            report[fname] = [str(err)]
+            continue
+        if desc is None:
+            continue
+        for name, entry in desc['datasets'].items():
+            chunks = entry.get('chunks')
+            layout[fname, name] = chunks, entry['shape']
+            step = block
+            if chunks and chunks[0] <= block:
+                step = block // chunks[0] * chunks[0]
+            n = entry['shape'][0]
+            for start in range(0, n, step):
+                end = min(start + step, n)
+                tasks.append((fname, name, start, end, entry['entries'][start:end], block))
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(max(1, workers))
+    try:
+        for fname, name, start, end, bad in pool.imap_unordered(_verify_range, tasks):
+            if not isinstance(bad, list):
+                report[fname].append('{}: entries {}-{} unreadable: {}'.format(name, start, end, bad))
+                continue
+            chunks, shape = layout[fname, name]
+            for i in bad:
+                where = 'entry {}'.format(i)
+                if chunks:
+                    where += ', HDF5 ' + _chunks_of(i, chunks, shape)
+                report[fname].append('{}: {} corrupted'.format(name, where))
+    finally:
+        pool.close()
+        pool.join()
+    return report
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('paths', nargs='+', help='Data Exchange files or directories holding them')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--block', type=int, default=16, help='entries hashed per task')
+    args = parser.parse_args()
+
+    fnames = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            fnames.extend(sorted(s[:-len('.checksums.json')] for s in glob.glob(os.path.join(path, '*.checksums.json'))))
+        else:
+            fnames.append(path)
+
+    report = verify_files(fnames, workers=args.workers, block=args.block)
+    failed = 0
+    for fname in fnames:
+        if report[fname]:
+            failed += 1
+            print ("FAILED: ", fname)
+            for problem in sorted(report[fname]):
+                print ("    ", problem)
+        else:
+            print ("OK: ", fname)
+    sys.exit(1 if failed else 0)
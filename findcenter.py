@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Automatic rotation center search for Data Exchange files
+"""
+
+from __future__ import print_function
+
+import os
+import json
+import argparse
+
+import numpy as np
+import h5py
+import tomopy
+import dxchange
+
+__all__ = ['center_from_projections',
+           'entropy_sweep',
+           'find_center']
+
+cache_fname = os.path.join(os.path.expanduser('~'), '.tomobank', 'centers.json')
+
+
+def center_from_projections(proj0, proj180):
+    """
+    Estimate the rotation center from two projections 180 degrees apart.
+
+    The mirrored 180 degree projection is the 0 degree one shifted by
+    2 * center - (ncol - 1); the shift is the peak of their FFT
+    cross-correlation.
+
+    Parameters
+    ----------
+    proj0, proj180 : ndarray
+        2D normalized projections (rows, columns).
+
+    Returns
+    -------
+    float
+        Rotation center in pixels.
+    """
+    ncol = proj0.shape[-1]
+    a = proj0 - proj0.mean()
+    b = proj180[:, ::-1] - proj180.mean()
+    corr = np.fft.irfft2(np.fft.rfft2(a) * np.conj(np.fft.rfft2(b)), s=a.shape)
+    shift = np.unravel_index(np.argmax(corr), corr.shape)[1]
+    if shift > ncol // 2:
+        shift -= ncol
+    return (ncol - 1 + shift) / 2.
+
+
+def entropy_sweep(sino, theta, centers, nbins=64):
+    """
+    Reconstruct one sinogram at every candidate center in a single gridrec
+    call and return the histogram entropy of each slice.
+
+    Parameters
+    ----------
+    sino : ndarray
+        Sinogram (projections, columns) after minus_log.
+    theta : ndarray
+        Projection angles in radian.
+    centers : ndarray
+        Candidate rotation centers.
+    nbins : int
+        Histogram bins.
+
+    Returns
+    -------
+    ndarray
+        Entropy of each candidate; the sharpest slice has the lowest.
+    """
+    centers = np.asarray(centers, dtype='float32')
+    ncand = centers.size
+    stack = np.repeat(sino[:, np.newaxis, :], ncand, axis=1)
+    rec = tomopy.recon(stack, theta, center=centers, algorithm='gridrec')
+    rec = tomopy.circ_mask(rec, axis=0, ratio=0.95)
+    lo, hi = rec.min(), rec.max()
+    idx = ((rec - lo) * (nbins / (hi - lo + 1e-12))).astype('int64')
+    np.clip(idx, 0, nbins - 1, out=idx)
+    idx += (np.arange(ncand) * nbins)[:, np.newaxis, np.newaxis]
+    hist = np.bincount(idx.ravel(), minlength=ncand * nbins).reshape(ncand, nbins)
+    p = hist / hist.sum(axis=1, keepdims=True).astype('float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return -np.nansum(p * np.log2(p), axis=1)
+
+
+def _read_cache():
+    try:
+        with open(cache_fname) as fp:
+            return json.load(fp)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _write_cache(cache):
+    dirPath = os.path.dirname(cache_fname)
+    if not os.path.exists(dirPath):
+        os.makedirs(dirPath)
+    # One temporary file per process, so that concurrent searches stay whole.
+    tmp = '{}.{}.tmp'.format(cache_fname, os.getpid())
+    with open(tmp, 'w') as fp:
+        json.dump(cache, fp, indent=2, sort_keys=True)
+    os.rename(tmp, cache_fname)
+
+
+def find_center(fname, tomo_id=None, row=None, level=2, radius=None, use_cache=True):
+    """
+    Find the rotation center of a Data Exchange file.
+
+    A first estimate comes from the cross-correlation of the 0 and 180
+    degree projections. It is refined with an entropy sweep on a sinogram
+    downsampled 2**level times in both columns and angles, then with a
+    half pixel sweep at full resolution.
+
+    Parameters
+    ----------
+    fname : str
+        Data Exchange file.
+    tomo_id : str, optional
+        Key of the result in the center cache. Defaults to the file name.
+    row : int, optional
+        Detector row used for the entropy sweeps. Defaults to the middle row.
+    level : int
+        Downsampling level of the coarse sweep.
+    radius : float, optional
+        Half width, in full resolution pixels, of the coarse sweep around
+        the first estimate. Defaults to 1/8 of the detector width.
+    use_cache : bool
+        Read and store the result in ~/.tomobank/centers.json.
+
+    Returns
+    -------
+    float
+        Rotation center in pixels.
+    """
+    if tomo_id is None:
+        tomo_id = os.path.splitext(os.path.basename(fname))[0]
+    stat = os.stat(fname)
+    key = [os.path.abspath(fname), stat.st_size, int(stat.st_mtime)]
+    with h5py.File(fname, 'r') as f:
+        nrow, ncol = f['/exchange/data'].shape[1:]
+    if row is None:
+        row = nrow // 2
+    # A search with other settings may find another center.
+    settings = {'row': row, 'level': level, 'radius': radius}
+    if use_cache:
+        entry = _read_cache().get(tomo_id)
+        if entry is not None and entry.get('file') == key and entry.get('settings') == settings:
+            return entry['center']
+
+    # Sinogram used by the entropy sweeps.
+    proj, flat, dark, theta = dxchange.read_aps_32id(fname, sino=(row, row + 1))
+    if theta is None:
+        theta = tomopy.angles(proj.shape[0])
+    sino = tomopy.minus_log(tomopy.normalize(proj, flat, dark))[:, 0, :]
+
+    # First estimate from the 0 and 180 degree projections.
+    center = (ncol - 1) / 2.
+    i180 = int(np.argmin(np.abs(theta - theta[0] - np.pi)))
+    if abs(theta[i180] - theta[0] - np.pi) <= 2 * abs(theta[1] - theta[0]):
+        p0, flat, dark, _ = dxchange.read_aps_32id(fname, proj=(0, 1))
+        p180 = dxchange.read_aps_32id(fname, proj=(i180, i180 + 1))[0]
+        p0 = tomopy.normalize(p0, flat, dark)[0]
+        p180 = tomopy.normalize(p180, flat, dark)[0]
+        center = center_from_projections(p0, p180)
+    if radius is None:
+        radius = ncol / 8.
+
+    # Coarse entropy sweep on the downsampled sinogram.
+    binning = 2 ** level
+    nc = ncol // binning
+    small = sino[::binning, :nc * binning].reshape(-1, nc, binning).mean(axis=2)
+    r = max(2, int(np.ceil(radius / binning)))
+    centers = (center + 0.5) / binning - 0.5 + np.arange(-r, r + 1)
+    entropy = entropy_sweep(small, theta[::binning], centers)
+    center = (centers[np.argmin(entropy)] + 0.5) * binning - 0.5
+
+    # Half pixel sweep at full resolution.
+    centers = center + np.arange(-binning, binning + 0.5, 0.5)
+    entropy = entropy_sweep(sino, theta, centers)
+    center = float(centers[np.argmin(entropy)])
+
+    if use_cache:
+        cache = _read_cache()
+        cache[tomo_id] = {'center': center, 'file': key, 'settings': settings}
+        _write_cache(cache)
+    return center
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('fname', help='Data Exchange file')
+    parser.add_argument('--tomo-id', default=None, help='cache key (default: file name)')
+    parser.add_argument('--row', type=int, default=None, help='detector row (default: middle row)')
+    parser.add_argument('--level', type=int, default=2, help='downsampling level of the coarse search')
+    parser.add_argument('--radius', type=float, default=None,
+                        help='half width in pixels of the coarse search (default: 1/8 of the detector width)')
+    parser.add_argument('--no-cache', action='store_true', help='ignore and do not update the cache')
+    args = parser.parse_args()
+
+    rot_center = find_center(args.fname, tomo_id=args.tomo_id, row=args.row,
+                             level=args.level, radius=args.radius, use_cache=not args.no_cache)
+    print ("Rotation center: ", rot_center)
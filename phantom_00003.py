@@ -13,6 +13,7 @@ import timeimport pytzimport datetimeimport numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 import dxfile.dxtomo as dx
+import dxconvert
 import dxchange
 
 def iso_time():
@@ -77,6 +78,11 @@ if __name__ == '__main__':
     #plt.imshow(ground_truth, interpolation='none', cmap=plt.cm.inferno)
     #plt.show()
 
+    # HDF5 layout of the projections: 'projection', 'sinogram' or 'balanced' chunks,
+    # None, 'lzf', 'gzip[:level]' or 'blosc[:codec]' compression.
+    chunks = 'projection'
+    compression = None
+
     # Save into a data-exchange file.
     if os.path.isfile(fname):
         print ("Data Exchange file already exists: ", fname)
@@ -86,8 +92,8 @@ if __name__ == '__main__':
         if not os.path.exists(dirPath):
             os.makedirs(dirPath)
 
-        # Open DataExchange file
-        f = dx.File(fname, mode='w')
+        # Open the partial DataExchange file, renamed to fname once complete
+        f = dxconvert.open_partial(fname, resume=False)
          
         # Write the Data Exchange HDF5 file.
         f.add_entry(dx.Entry.experimenter(affiliation={'value': experimenter_affiliation}))
@@ -95,10 +101,7 @@ if __name__ == '__main__':
         f.add_entry(dx.Entry.instrument(name={'value': instrument_name}))
         f.add_entry(dx.Entry.sample(name={'value': sample_name}))
 
-        f.add_entry(dx.Entry.data(data={'value': proj, 'units':'counts'}))
-        f.add_entry(dx.Entry.data(data_white={'value': flat, 'units':'counts'}))
-        f.add_entry(dx.Entry.data(data_dark={'value': dark, 'units':'counts'}))
-        f.add_entry(dx.Entry.data(theta={'value': theta, 'units':'degrees'}))
+        dxconvert.write_data(f, proj, flat, dark, theta, chunks=chunks, compression=compression)
         f.add_entry(dx.Entry.data(ground_truth={'value': ground_truth, 'units':'counts'}))
 
         f.add_entry(dx.Entry.acquisition(start_date={'value': start_date}))
@@ -108,7 +111,7 @@ if __name__ == '__main__':
         f.add_entry(dx.Entry.acquisition_setup(rotation_end_angle={'value': end_angle, 'unit': end_angle_unit}))
         f.add_entry(dx.Entry.acquisition_setup(angular_step={'value': theta_step_deg, 'unit': angular_step_unit}))
 
-        f.close()
+        dxconvert.finish(f, fname)
         
        
         
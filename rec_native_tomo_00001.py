@@ -10,6 +10,9 @@ from __future__ import print_function
 import os
 import tomopy
 import dxchange
+import autotune
+import recpipe
+import tiffio
 
 
 
@@ -35,22 +38,23 @@ if __name__ == '__main__':
     start = 200
     end = 204
 
-    # Read the APS 2-BM raw data.
-    proj, flat, dark = dxchange.read_anka_topotomo(fname, ind_tomo, ind_flat, ind_dark, sino=(start, end))
+    # Read the APS 2-BM raw data: only the strips holding rows start:end are read from each tiff.
+    proj_fnames, flat_fnames, dark_fnames = tiffio.anka_fnames(fname, ind_tomo, ind_flat, ind_dark)
+    proj = tiffio.read_stack(proj_fnames, sino=(start, end))
+    flat = tiffio.read_stack(flat_fnames, sino=(start, end))
+    dark = tiffio.read_stack(dark_fnames, sino=(start, end))
 
     # Set data collection angles as equally spaced between 0-180 degrees.
     theta = tomopy.angles(proj.shape[0], 0, 180)
    
-    # Flat-field correction of raw data.
-    proj = tomopy.normalize(proj, flat, dark)
-
     # Set rotation center.
     rot_center = 1024
 
-    tomopy.minus_log(proj)
+    # Flat-field correction and -log of raw data in a single pass.
+    proj = recpipe.normalize_log(proj, flat, dark)
 
     # Reconstruct object using Gridrec algorithm.
-    rec = tomopy.recon(proj, theta, center=rot_center, algorithm='gridrec', nchunk=1)
+    rec = autotune.recon(proj, theta, center=rot_center)
 
     # Mask each reconstructed slice with a circle.
     rec = tomopy.circ_mask(rec, axis=0, ratio=0.95)
@@ -10,6 +10,7 @@ from __future__ import print_function
 import os
 import tomopy
 import dxchange
+import autotune
 
 if __name__ == '__main__':
     # Set tomobank id
@@ -35,7 +36,7 @@ if __name__ == '__main__':
     #proj = tomopy.minus_log(proj)
 
     # Reconstruct object using Gridrec algorithm.
-    rec = tomopy.recon(proj, theta, center=rot_center, algorithm='gridrec', nchunk=1)
+    rec = autotune.recon(proj, theta, center=rot_center)
 
     # Mask each reconstructed slice with a circle.
     rec = tomopy.circ_mask(rec, axis=0, ratio=0.95)
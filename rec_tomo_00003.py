@@ -10,6 +10,8 @@ from __future__ import print_function
 import os
 import tomopy
 import dxchange
+import autotune
+import recpipe
 
 if __name__ == '__main__':
     # Set tomobank id
@@ -25,16 +27,14 @@ if __name__ == '__main__':
     # Read the APS 2-BM raw data.
     proj, flat, dark, theta = dxchange.read_aps_32id(fname, sino=(start, end))
     
-    # Flat-field correction of raw data.
-    proj = tomopy.normalize(proj, flat, dark)
-
     # Set rotation center.
     rot_center = 1011
 
-    proj = tomopy.minus_log(proj)
+    # Flat-field correction and -log of raw data in a single pass.
+    proj = recpipe.normalize_log(proj, flat, dark)
 
     # Reconstruct object using Gridrec algorithm.
-    rec = tomopy.recon(proj, theta, center=rot_center, algorithm='gridrec', nchunk=1)
+    rec = autotune.recon(proj, theta, center=rot_center)
 
     # Mask each reconstructed slice with a circle.
     rec = tomopy.circ_mask(rec, axis=0, ratio=0.95)
@@ -2,52 +2,35 @@
 # -*- coding: utf-8 -*-
 
 """
-TomoPy example script to reconstruct tomo_00032 to tomo_00055 APS 2-BM 
+TomoPy example script to reconstruct tomo_00058 to tomo_00063 APS 2-BM
 """
 
 from __future__ import print_function
 
-import tomopy
+import functools
 import dxchange
+import recpipe
 
-if __name__ == '__main__':
+# (sample_name, tomo_id, sample_detector_distance, rot_center) of each dataset.
+datasets = [
+    ('somya_20_60', 'tomo_00058', 60, 1427),
+    ('somya_30_60', 'tomo_00059', 60, 1440),
+    ('somya_30_25', 'tomo_00060', 25, 1337),
+    ('somya_20_25', 'tomo_00061', 25, 1316.5),
+    ('somya_10_25', 'tomo_00062', 25, 1359.5),
+    ('somya_5_25', 'tomo_00063', 25, 1322.5),
+    ]
 
+detector_pixel_size_x = 0.65e-4
+monochromator_energy = 27.4
 
-    sample_name = 'somya_20_60'
-    tomo_id = 'tomo_00058'
-    sample_detector_distance = 60
-    rot_center = 1427
 
-    sample_name = 'somya_30_60'
-    tomo_id = 'tomo_00059'
-    sample_detector_distance = 60
-    rot_center = 1440
-    
-    sample_name = 'somya_30_25'
-    tomo_id = 'tomo_00060'
-    sample_detector_distance = 25
-    rot_center = 1337
+def read(fname, sino):
+    # Read raw data.
+    return dxchange.read_aps_32id(fname, sino=sino)
 
-    sample_name = 'somya_20_25'
-    tomo_id = 'tomo_00061'
-    sample_detector_distance = 25
-    rot_center = 1316.5
-    
-    sample_name = 'somya_10_25'
-    tomo_id = 'tomo_00062'
-    sample_detector_distance = 25
-    rot_center = 1359.5
-    
-    sample_name = 'somya_5_25'
-    tomo_id = 'tomo_00063'
-    sample_detector_distance = 25
-    rot_center =  1322.5  
 
-    detector_pixel_size_x = 0.65e-4
-    monochromator_energy = 27.4
-       
-    # Set path to the micro-CT data to reconstruct.
-    fname = '/local/decarlo/data/tomobank/datasets/tomo_00058_to_00063/' + tomo_id + '.h5'
+if __name__ == '__main__':
 
     # Select the sinogram range to reconstruct.
     start = 1022
@@ -55,28 +38,19 @@ if __name__ == '__main__':
 
     sino=(start, end)
 
-    # Read raw data.
-    proj, flat, dark, theta = dxchange.read_aps_32id(fname, sino=(start, end))
-
-    # Flat-field correction of raw data.
-    data = tomopy.normalize(proj, flat, dark)
-
-    # remove stripes    
-    data = tomopy.prep.stripe.remove_stripe_fw(data,level=5,wname='sym16',sigma=1,pad=True)
-
-    # phase retrieval
-    data = tomopy.prep.phase.retrieve_phase(data,pixel_size=detector_pixel_size_x,dist=sample_detector_distance,energy=monochromator_energy,alpha=8e-3,pad=True)
-
-    # Set rotation center.
-    rot_center = rot_center
-
-    data = tomopy.minus_log(data)
+    # Set path to the micro-CT data to reconstruct.
+    fnames = ['/local/decarlo/data/tomobank/datasets/tomo_00058_to_00063/' + tomo_id + '.h5' for _, tomo_id, _, _ in datasets]
 
-    # Reconstruct object using Gridrec algorithm.
-    rec = tomopy.recon(data, theta, center=rot_center, algorithm='gridrec')
+    # Read dataset N+1 while dataset N is being reconstructed.
+    loaders = [functools.partial(read, fname, sino) for fname in fnames]
+    for (sample_name, tomo_id, sample_detector_distance, rot_center), raw in zip(datasets, recpipe.prefetch(loaders)):
+        print (tomo_id, sample_name)
+        proj, flat, dark, theta = raw
 
-    # Mask each reconstructed slice with a circle.
-    rec = tomopy.circ_mask(rec, axis=0, ratio=0.95)
+        rec = recpipe.reconstruct(proj, flat, dark, theta, rot_center,
+                                  pixel_size=detector_pixel_size_x,
+                                  dist=sample_detector_distance,
+                                  energy=monochromator_energy)
 
-    # Write data as stack of TIFs.
-    dxchange.write_tiff_stack(rec, fname='recon_dir/aps_nik')
+        # Write data as stack of TIFs.
+        dxchange.write_tiff_stack(rec, fname='recon_dir/' + tomo_id)
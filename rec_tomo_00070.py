@@ -9,6 +9,8 @@ from __future__ import print_function
 
 import tomopy
 import dxchange
+import recpipe
+import sinocache
 
 if __name__ == '__main__':
 
@@ -29,28 +31,55 @@ if __name__ == '__main__':
 
     sino=(start, end)
 
-    # Read raw data.
-    proj, flat, dark, theta = dxchange.read_aps_32id(fname, sino=(start, end))
+    # Reconstruct all detector rows in memory sized sinogram blocks instead of start:end.
+    full_volume = False
 
-    # Flat-field correction of raw data.
-    data = tomopy.normalize(proj, flat, dark)
+    # Keep the preprocessed sinograms on disk so that gridrec-only reruns skip preprocessing.
+    use_cache = False
 
-    # remove stripes    
-    data = tomopy.prep.stripe.remove_stripe_fw(data,level=5,wname='sym16',sigma=1,pad=True)
+    # Write the wall/CPU time, bytes and memory of every pipeline stage to this JSON (or .csv) file.
+    profile = None
 
-    # phase retrieval
-    data = tomopy.prep.phase.retrieve_phase(data,pixel_size=detector_pixel_size_x,dist=sample_detector_distance,energy=monochromator_energy,alpha=8e-3,pad=True)
+    # RAM budget in bytes sizing the sinogram blocks and tomopy workers, e.g. 64 * 1024 ** 3; None uses the available memory.
+    memory_budget = None
 
-    # Set rotation center.
-    rot_center = rot_center
+    # Use the gridrec workers and chunks tuned for this machine, calibrated on the first run; see autotune.
+    tune = False
 
-    data = tomopy.minus_log(data)
+    if full_volume or use_cache or profile is not None:
+        cache = sinocache.SinoCache() if use_cache else None
+        recpipe.reconstruct_volume(fname, rot_center, 'recon_dir/tomo_00070',
+                                   pixel_size=detector_pixel_size_x,
+                                   dist=sample_detector_distance,
+                                   energy=monochromator_energy,
+                                   sino=None if full_volume else sino,
+                                   cache=cache,
+                                   profile=profile,
+                                   memory=memory_budget,
+                                   tune=tune)
+    else:
+        # Read raw data.
+        proj, flat, dark, theta = dxchange.read_aps_32id(fname, sino=(start, end))
 
-    # Reconstruct object using Gridrec algorithm.
-    rec = tomopy.recon(data, theta, center=rot_center, algorithm='gridrec')
+        # Flat-field correction of raw data.
+        data = recpipe.normalize(proj, flat, dark)
 
-    # Mask each reconstructed slice with a circle.
-    rec = tomopy.circ_mask(rec, axis=0, ratio=0.95)
+        # remove stripes    
+        data = tomopy.prep.stripe.remove_stripe_fw(data,level=5,wname='sym16',sigma=1,pad=True)
 
-    # Write data as stack of TIFs.
-    dxchange.write_tiff_stack(rec, fname='recon_dir/tomo_00070')
+        # phase retrieval
+        data = tomopy.prep.phase.retrieve_phase(data,pixel_size=detector_pixel_size_x,dist=sample_detector_distance,energy=monochromator_energy,alpha=8e-3,pad=True)
+
+        # Set rotation center.
+        rot_center = rot_center
+
+        data = recpipe.minus_log(data)
+
+        # Reconstruct object using Gridrec algorithm.
+        rec = tomopy.recon(data, theta, center=rot_center, algorithm='gridrec')
+
+        # Mask each reconstructed slice with a circle.
+        rec = tomopy.circ_mask(rec, axis=0, ratio=0.95)
+
+        # Write data as stack of TIFs.
+        dxchange.write_tiff_stack(rec, fname='recon_dir/tomo_00070')
@@ -0,0 +1,577 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Reconstruction pipeline shared by the rec_tomo_* scripts
+"""
+
+from __future__ import print_function
+
+import os
+import threading
+import multiprocessing
+
+import numpy as np
+import h5py
+import tomopy
+import dxchange
+import findcenter
+import tomoprof
+import autotune
+
+__all__ = ['normalize',
+           'minus_log',
+           'normalize_log',
+           'preprocess',
+           'recon_block',
+           'reconstruct',
+           'prefetch',
+           'available_memory',
+           'pipeline_memory',
+           'plan_blocks',
+           'phase_halo',
+           'reconstruct_volume']
+
+
+# Bytes of float32 projections processed per pass, small enough to stay in cache.
+pass_bytes = 1024 ** 2
+
+
+def _passes(shape):
+    step = max(1, pass_bytes // (int(np.prod(shape[1:])) * 4))
+    return [(i, min(i + step, shape[0])) for i in range(0, shape[0], step)]
+
+
+def _log(block, clip):
+    if clip:
+        np.copyto(block, 1, where=block <= 0)
+    np.log(block, out=block)
+    np.negative(block, out=block)
+
+
+def _correct(proj, flat, dark, cutoff, out, log, clip):
+    # The flat and dark averages and the scale are computed once per block.
+    dark = np.mean(dark, axis=0, dtype=np.float32)
+    scale = np.mean(flat, axis=0, dtype=np.float32) - dark
+    scale[scale < 1e-6] = 1e-6
+    np.reciprocal(scale, out=scale)
+    if out is None:
+        if proj.dtype == np.float32:
+            out = proj
+        else:
+            out = np.empty(proj.shape, dtype=np.float32)
+    for s, e in _passes(proj.shape):
+        block = out[s:e]
+        np.subtract(proj[s:e], dark, out=block)
+        np.multiply(block, scale, out=block)
+        if cutoff is not None:
+            np.minimum(block, cutoff, out=block)
+        if log:
+            _log(block, clip)
+    return out
+
+
+def normalize(proj, flat, dark, cutoff=None, out=None):
+    """
+    Flat and dark field correction, as tomopy.normalize, in float32.
+
+    float32 projections are corrected in place; others are written to
+    out, or to a new float32 array. The projections go through the
+    subtraction and the scaling a cache sized group at a time.
+
+    Parameters
+    ----------
+    proj, flat, dark : ndarray
+        Projections, flat and dark fields.
+    cutoff : float, optional
+        Upper bound of the corrected values.
+    out : ndarray, optional
+        float32 output with the shape of proj, e.g. reused across blocks.
+
+    Returns
+    -------
+    ndarray
+        Corrected projections.
+    """
+    return _correct(proj, flat, dark, cutoff, out, False, False)
+
+
+def minus_log(data, clip=False):
+    """
+    In place -log of float32 data, as tomopy.minus_log.
+
+    Parameters
+    ----------
+    data : ndarray
+        float32 data, overwritten.
+    clip : bool, optional
+        Set non-positive values to 1 (0 after the logarithm) first.
+
+    Returns
+    -------
+    ndarray
+        data.
+    """
+    for s, e in _passes(data.shape):
+        _log(data[s:e], clip)
+    return data
+
+
+def normalize_log(proj, flat, dark, clip=False, cutoff=None, out=None):
+    """
+    normalize and minus_log fused in a single pass over the projections,
+    for pipelines with no filter in between.
+
+    Parameters
+    ----------
+    proj, flat, dark : ndarray
+        Projections, flat and dark fields.
+    clip : bool, optional
+        Set non-positive values to 1 before taking the logarithm.
+    cutoff : float, optional
+        Upper bound of the corrected values.
+    out : ndarray, optional
+        float32 output with the shape of proj.
+
+    Returns
+    -------
+    ndarray
+        Sinograms ready for reconstruction.
+    """
+    return _correct(proj, flat, dark, cutoff, out, True, clip)
+
+
+def preprocess(proj, flat, dark, pixel_size=None, dist=None, energy=None,
+               alpha=8e-3, clip=False, rows=None, out=None, ncore=None):
+    """
+    Run normalize, remove_stripe_fw, retrieve_phase and minus_log on a
+    block of raw projections.
+
+    Parameters
+    ----------
+    proj, flat, dark : ndarray
+        Raw projections, flat and dark fields.
+    pixel_size : float, optional
+        Detector pixel size in cm. Phase retrieval is skipped when None.
+    dist : float, optional
+        Sample detector distance in cm.
+    energy : float, optional
+        Energy in keV.
+    alpha : float, optional
+        Regularization parameter of the phase retrieval.
+    clip : bool, optional
+        Set non-positive values to 1 before taking the logarithm.
+    rows : slice, optional
+        Sinograms kept after phase retrieval; the others are the halo read
+        around the block and are discarded.
+    out : ndarray, optional
+        float32 buffer with the shape of proj for the flat-field
+        correction, e.g. reused across blocks.
+    ncore : int, optional
+        Number of tomopy workers. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    ndarray
+        Sinograms ready for reconstruction.
+    """
+    # Flat-field correction of raw data.
+    with tomoprof.stage('normalize', proj, flat, dark) as st:
+        data = normalize(proj, flat, dark, out=out)
+        st.output(data)
+
+    # remove stripes
+    with tomoprof.stage('remove_stripe_fw', data) as st:
+        data = tomopy.prep.stripe.remove_stripe_fw(data, level=5, wname='sym16', sigma=1, pad=True, ncore=ncore)
+        st.output(data)
+
+    # phase retrieval
+    if pixel_size is not None:
+        with tomoprof.stage('retrieve_phase', data) as st:
+            data = tomopy.prep.phase.retrieve_phase(data, pixel_size=pixel_size, dist=dist, energy=energy, alpha=alpha, pad=True, ncore=ncore)
+            st.output(data)
+
+    # discard the halo
+    if rows is not None:
+        data = data[:, rows]
+
+    with tomoprof.stage('minus_log', data) as st:
+        data = minus_log(data, clip)
+        st.output(data)
+    return data
+
+
+def recon_block(data, theta, rot_center, ncore=None, nchunk=None):
+    """
+    Reconstruct preprocessed sinograms with gridrec and mask each slice
+    with a circle, with ncore tomopy workers (defaults to the number of
+    CPUs) taking nchunk sinograms at a time (defaults to tomopy's split).
+    """
+    # Reconstruct object using Gridrec algorithm.
+    with tomoprof.stage('gridrec', data) as st:
+        rec = tomopy.recon(data, theta, center=rot_center, algorithm='gridrec', ncore=ncore, nchunk=nchunk)
+        st.output(rec)
+
+    # Mask each reconstructed slice with a circle.
+    with tomoprof.stage('circ_mask', rec) as st:
+        rec = tomopy.circ_mask(rec, axis=0, ratio=0.95, ncore=ncore)
+        st.output(rec)
+    return rec
+
+
+def reconstruct(proj, flat, dark, theta, rot_center, ncore=None, **kwargs):
+    """
+    Run normalize, remove_stripe_fw, retrieve_phase, minus_log, gridrec
+    and circ_mask on a block of raw projections.
+
+    Parameters
+    ----------
+    proj, flat, dark : ndarray
+        Raw projections, flat and dark fields.
+    theta : ndarray
+        Projection angles in radian.
+    rot_center : float
+        Rotation center.
+    ncore : int, optional
+        Number of tomopy workers. Defaults to the number of CPUs.
+    **kwargs
+        Forwarded to preprocess.
+
+    Returns
+    -------
+    ndarray
+        Reconstructed slices.
+    """
+    return recon_block(preprocess(proj, flat, dark, ncore=ncore, **kwargs), theta, rot_center, ncore)
+
+
+def prefetch(loaders):
+    """
+    Call each loader in a background thread one step ahead of the consumer.
+
+    While the caller processes the result of loader N (tomopy releases the
+    GIL in its compiled kernels) loader N+1 is already reading from disk.
+
+    Parameters
+    ----------
+    loaders : iterable of callable
+        Functions taking no argument and returning the data to process.
+
+    Yields
+    ------
+    object
+        The value returned by each loader, in order.
+    """
+    loaders = iter(loaders)
+
+    def start(loader):
+        box = {}
+
+        def run():
+            try:
+                box['value'] = loader()
+            except BaseException as e:
+                box['error'] = e
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread, box
+
+    try:
+        pending = start(next(loaders))
+    except StopIteration:
+        return
+    for loader in loaders:
+        value = _join(pending)
+        pending = start(loader)
+        yield value
+    yield _join(pending)
+
+
+def _join(pending):
+    thread, box = pending
+    thread.join()
+    if 'error' in box:
+        raise box['error']
+    return box['value']
+
+
+def available_memory():
+    """
+    Return the memory available to new allocations in bytes.
+    """
+    try:
+        with open('/proc/meminfo') as fp:
+            for line in fp:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+def _pow2(n):
+    return 1 << int(np.ceil(np.log2(max(1, n))))
+
+
+def pipeline_memory(shape, nflat, ndark, itemsize, block, ncore=1, halo=0, phase=False):
+    """
+    Estimated peak memory of reconstruct_volume for a block of sinograms.
+
+    The pipeline holds, per detector row read, two raw blocks (the one
+    being processed and the one being prefetched) and three float32
+    copies of the projections (the normalized work buffer and the outputs
+    of remove_stripe_fw and retrieve_phase), and per reconstructed row
+    the gridrec and circ_mask slices. Each tomopy worker adds its own
+    scratch: remove_stripe_fw pads a sinogram by an eighth of the
+    projections and keeps its wavelet coefficients and their FFT,
+    retrieve_phase pads a projection to powers of two, past the halo, and
+    keeps its complex FFT, gridrec grids a slice on a twice oversampled
+    power of two complex grid.
+
+    Parameters
+    ----------
+    shape : tuple
+        (projections, rows, columns) of the data.
+    nflat, ndark : int
+        Number of flat and dark fields.
+    itemsize : int
+        Bytes per raw value.
+    block : int
+        Sinograms per block.
+    ncore : int, optional
+        Number of tomopy workers.
+    halo : int, optional
+        Rows read above and below each block.
+    phase : bool, optional
+        Whether retrieve_phase runs.
+
+    Returns
+    -------
+    int
+        Bytes.
+    """
+    nproj, nrow, ncol = shape
+    rows = min(nrow, block + 2 * halo)
+    raw = 2 * rows * (nproj + nflat + ndark) * ncol * itemsize
+    work = (3 if phase else 2) * rows * nproj * ncol * 4
+    rec = 2 * block * ncol * ncol * 4
+    scratch = 3 * (nproj + nproj // 8) * ncol * 4 + 8 * (2 * _pow2(ncol)) ** 2
+    shared = 0
+    if phase:
+        padded = _pow2(rows + halo) * _pow2(ncol + halo)
+        scratch = max(scratch, 36 * padded)
+        shared = 8 * padded
+    return int(raw + work + rec + ncore * scratch + shared)
+
+
+def plan_blocks(fname, memory=None, fraction=0.8, ncore=None, halo=0, phase=False):
+    """
+    Sinograms per block and number of tomopy workers that fit the
+    pipeline of reconstruct_volume in a memory budget, see
+    pipeline_memory.
+
+    Workers are dropped, starting from ncore, until the largest block
+    that fits gives each of them at least one sinogram.
+
+    Parameters
+    ----------
+    fname : str
+        Data Exchange file to reconstruct.
+    memory : int, optional
+        Memory budget in bytes. Defaults to the available memory.
+    fraction : float, optional
+        Fraction of the budget actually used, leaving room for the
+        interpreter, the libraries and the estimate's errors.
+    ncore : int, optional
+        Maximum number of tomopy workers. Defaults to the number of CPUs.
+    halo : int, optional
+        Rows read above and below each block.
+    phase : bool, optional
+        Whether retrieve_phase runs.
+
+    Returns
+    -------
+    tuple of int
+        (sinograms per block, number of workers).
+    """
+    if memory is None:
+        memory = available_memory()
+    if ncore is None:
+        ncore = multiprocessing.cpu_count()
+    with h5py.File(fname, 'r') as f:
+        shape = f['/exchange/data'].shape
+        itemsize = f['/exchange/data'].dtype.itemsize
+        nflat = f['/exchange/data_white'].shape[0]
+        ndark = f['/exchange/data_dark'].shape[0]
+    budget = memory * fraction
+
+    def cost(block, workers):
+        return pipeline_memory(shape, nflat, ndark, itemsize, block, workers, halo, phase)
+
+    for workers in range(ncore, 0, -1):
+        if cost(1, workers) > budget:
+            continue
+        # The estimate grows with the block: bisect the largest that fits.
+        lo, hi = 1, shape[1]
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if cost(mid, workers) <= budget:
+                lo = mid
+            else:
+                hi = mid - 1
+        if lo >= min(shape[1], workers) or workers == 1:
+            return lo, workers
+    raise MemoryError('{}: a single sinogram needs about {:.0f} MB, over the {:.0f} MB budget'.format(
+        fname, cost(1, 1) / 1e6, budget / 1e6))
+
+
+def phase_halo(pixel_size, dist, energy):
+    """
+    Number of detector rows the Paganin filter of retrieve_phase spreads
+    over; the same estimate tomopy uses to pad the projections.
+
+    Parameters
+    ----------
+    pixel_size : float
+        Detector pixel size in cm.
+    dist : float
+        Propagation distance in cm.
+    energy : float
+        Energy in keV.
+
+    Returns
+    -------
+    int
+        Halo height in rows.
+    """
+    wavelength = 1.23984193e-7 / energy
+    return int(np.ceil(np.pi * wavelength * dist / pixel_size ** 2))
+
+
+def reconstruct_volume(fname, rot_center, out_fname, sino=None, block=None,
+                       halo=None, cache=None, profile=None, memory=None, ncore=None,
+                       tune=False, **kwargs):
+    """
+    Reconstruct all (or a range of) detector rows in sinogram blocks.
+
+    Block N+1 is read in a background thread while block N goes through
+    normalize, remove_stripe_fw, retrieve_phase, minus_log, gridrec and
+    circ_mask; each block is then appended to the tiff stack.
+
+    retrieve_phase filters across detector rows, so each block is read
+    with halo extra rows on both sides, filtered, and the halo discarded
+    before gridrec: the stack has no seams at block boundaries.
+
+    With a cache, the preprocessed sinograms of each block are stored and
+    later runs with the same file, range and preprocessing parameters
+    only run gridrec and circ_mask.
+
+    Parameters
+    ----------
+    fname : str
+        Data Exchange file to reconstruct.
+    rot_center : float
+        Rotation center. None searches it with findcenter.find_center.
+    out_fname : str
+        Base name of the output tiff stack.
+    sino : tuple, optional
+        (start, end) rows to reconstruct. Defaults to all rows.
+    block : int, optional
+        Sinograms per block. Defaults to the largest that fits the memory
+        budget, see plan_blocks.
+    halo : int, optional
+        Rows read around each block for phase retrieval. Defaults to
+        phase_halo() when phase retrieval is on, 0 otherwise.
+    cache : sinocache.SinoCache, optional
+        Cache of the preprocessed sinograms.
+    profile : str, optional
+        File receiving the timings of every stage, as JSON or, when it
+        ends with .csv, as CSV; see tomoprof.
+    memory : int, optional
+        Memory budget in bytes for choosing block and ncore. Defaults to
+        the available memory.
+    ncore : int, optional
+        Number of tomopy workers; with block unset, the maximum that
+        plan_blocks may use. Defaults to the number of CPUs.
+    tune : bool, optional
+        Use the gridrec workers, chunks and, with block unset, block size
+        tuned for this machine and geometry, see autotune.tuned; the first
+        run on a new geometry spends a few seconds calibrating them.
+    **kwargs
+        Forwarded to preprocess.
+    """
+    if profile is None:
+        _reconstruct_volume(fname, rot_center, out_fname, sino, block, halo, cache, memory, ncore, tune, kwargs)
+        return
+    with tomoprof.profiling(profile, label=fname) as prof:
+        _reconstruct_volume(fname, rot_center, out_fname, sino, block, halo, cache, memory, ncore, tune, kwargs)
+    prof.show()
+
+
+def _reconstruct_volume(fname, rot_center, out_fname, sino, block, halo, cache, memory, ncore, tune, kwargs):
+    with h5py.File(fname, 'r') as f:
+        nproj, nrow, ncol = f['/exchange/data'].shape
+    if sino is None:
+        sino = (0, nrow)
+    if rot_center is None:
+        rot_center = findcenter.find_center(fname)
+        print ("Rotation center: ", rot_center)
+    if halo is None:
+        halo = 0
+        if kwargs.get('pixel_size') is not None:
+            halo = phase_halo(kwargs['pixel_size'], kwargs['dist'], kwargs['energy'])
+    planned = block is None
+    if planned:
+        block, ncore = plan_blocks(fname, memory, ncore=ncore, halo=halo,
+                                   phase=kwargs.get('pixel_size') is not None)
+    nchunk = None
+    if tune:
+        # The memory plan bounds the block and the workers tried.
+        conf = autotune.tuned(nproj, min(block, sino[1] - sino[0]), ncol, max_ncore=ncore)
+        ncore, nchunk = conf['ncore'], conf['nchunk']
+        if planned:
+            block = conf['block']
+    print ("Sinograms per block: ", block, " tomopy workers: ", ncore, " chunk: ", nchunk)
+    blocks = [(s, min(s + block, sino[1])) for s in range(sino[0], sino[1], block)]
+
+    def read_range(s, e):
+        return max(0, s - halo), min(nrow, e + halo)
+
+    def cache_key(s, e):
+        params = dict(kwargs, rows=[s, e], stripe=['fw', 5, 'sym16', 1])
+        return cache.key(fname, read_range(s, e), params)
+
+    def loader(s, e):
+        def load():
+            if cache is not None:
+                with tomoprof.stage('cache_load') as st:
+                    hit = cache.load(cache_key(s, e))
+                    if hit is not None:
+                        st.output(hit['data'])
+                        return hit['data'], hit['theta']
+            with tomoprof.stage('read') as st:
+                raw = dxchange.read_aps_32id(fname, sino=read_range(s, e))
+                st.output(*raw)
+            return raw
+        return load
+
+    work = None
+    for (s, e), raw in zip(blocks, prefetch([loader(s, e) for s, e in blocks])):
+        print ("Reconstructing sinograms: ", s, e)
+        if len(raw) == 2:
+            data, theta = raw
+        else:
+            proj, flat, dark, theta = raw
+            s0 = read_range(s, e)[0]
+            if work is None or work.shape != proj.shape:
+                work = np.empty(proj.shape, dtype=np.float32)
+            data = preprocess(proj, flat, dark, rows=slice(s - s0, e - s0), out=work,
+                              ncore=ncore, **kwargs)
+            if cache is not None:
+                with tomoprof.stage('cache_store', data):
+                    cache.store(cache_key(s, e), data=data, theta=theta)
+        rec = recon_block(data, theta, rot_center, ncore, nchunk)
+        with tomoprof.stage('write_tiff_stack', rec):
+            dxchange.write_tiff_stack(rec, fname=out_fname, start=s)
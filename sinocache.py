@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Content addressed on-disk cache of preprocessed sinograms
+"""
+
+from __future__ import print_function
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+import numpy as np
+
+__all__ = ['file_hash',
+           'SinoCache']
+
+
+def file_hash(fname, blocksize=64 * 1024 * 1024):
+    """
+    Return the sha1 of the content of a file.
+
+    Parameters
+    ----------
+    fname : str
+        File to hash.
+    blocksize : int
+        Bytes read at a time.
+
+    Returns
+    -------
+    str
+        Hex digest.
+    """
+    h = hashlib.sha1()
+    with open(fname, 'rb') as fp:
+        while True:
+            buf = fp.read(blocksize)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+
+class SinoCache(object):
+    """
+    Cache of intermediate arrays stored as .npy files that are memory
+    mapped when read back.
+
+    Entries are keyed by the hash of the input file, the sinogram range
+    and the preprocessing parameters. When the cache grows over budget
+    bytes the least recently used entries are removed. A hit only
+    touches the entry directory; the index is rewritten, under a lock,
+    when files are hashed and entries stored, so the prefetch thread
+    loading entries and the main thread storing them do not race.
+
+    Parameters
+    ----------
+    path : str, optional
+        Cache directory. Defaults to ~/.tomobank/sinocache.
+    budget : int, optional
+        Disk budget in bytes.
+    """
+
+    def __init__(self, path=None, budget=50 * 1024 ** 3):
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'), '.tomobank', 'sinocache')
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.budget = budget
+        self.index_fname = os.path.join(path, 'index.json')
+        self._lock = threading.Lock()
+
+    def _read_index(self):
+        try:
+            with open(self.index_fname) as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return {'entries': {}, 'files': {}}
+
+    def _write_index(self, index):
+        # One temporary file per writer, so that concurrent renames stay whole.
+        tmp = '{}.{}.{}.tmp'.format(self.index_fname, os.getpid(), threading.current_thread().ident)
+        with open(tmp, 'w') as fp:
+            json.dump(index, fp, indent=2, sort_keys=True)
+        os.rename(tmp, self.index_fname)
+
+    def file_hash(self, fname):
+        """
+        Content hash of fname, recomputed only when its size or mtime change.
+        """
+        fname = os.path.abspath(fname)
+        stat = os.stat(fname)
+        index = self._read_index()
+        known = index['files'].get(fname)
+        if known is not None and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+            return known['hash']
+        digest = file_hash(fname)
+        with self._lock:
+            index = self._read_index()
+            index['files'][fname] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': digest}
+            self._write_index(index)
+        return digest
+
+    def key(self, fname, sino, params):
+        """
+        Cache key of the sinograms sino of fname preprocessed with params.
+
+        Parameters
+        ----------
+        fname : str
+            Input file.
+        sino : tuple
+            (start, end) of the sinograms read.
+        params : dict
+            Preprocessing parameters; must be JSON serializable.
+        """
+        desc = json.dumps([self.file_hash(fname), list(sino), params], sort_keys=True)
+        return hashlib.sha1(desc.encode('utf-8')).hexdigest()
+
+    def load(self, key):
+        """
+        Return the arrays stored under key as read-only memory maps, or
+        None on a miss.
+        """
+        index = self._read_index()
+        entry = index['entries'].get(key)
+        dirPath = os.path.join(self.path, key)
+        if entry is None or not os.path.isdir(dirPath):
+            return None
+        arrays = {}
+        try:
+            for name in entry['names']:
+                arrays[name] = np.load(os.path.join(dirPath, name + '.npy'), mmap_mode='r')
+            # The directory times record the use, see _evict.
+            os.utime(dirPath, None)
+        except (IOError, OSError):
+            # Evicted meanwhile by another thread or process.
+            return None
+        return arrays
+
+    def store(self, key, **arrays):
+        """
+        Store arrays under key then evict least recently used entries
+        until the cache fits the budget.
+        """
+        tmp = os.path.join(self.path, key + '.tmp')
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        size = 0
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), np.asarray(array))
+            size += os.path.getsize(os.path.join(tmp, name + '.npy'))
+        dirPath = os.path.join(self.path, key)
+        if os.path.exists(dirPath):
+            shutil.rmtree(dirPath)
+        os.rename(tmp, dirPath)
+
+        with self._lock:
+            index = self._read_index()
+            index['entries'][key] = {'names': sorted(arrays), 'size': size, 'atime': time.time()}
+            self._evict(index, keep=key)
+            self._write_index(index)
+
+    def _used(self, key, entry):
+        # Time of the last store or load of an entry.
+        try:
+            return max(entry['atime'], os.path.getmtime(os.path.join(self.path, key)))
+        except OSError:
+            return entry['atime']
+
+    def _evict(self, index, keep=None):
+        entries = index['entries']
+        total = sum(e['size'] for e in entries.values())
+        for key in sorted(entries, key=lambda k: self._used(k, entries[k])):
+            if total <= self.budget:
+                break
+            if key == keep:
+                continue
+            total -= entries[key]['size']
+            shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+            del entries[key]
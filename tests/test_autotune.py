@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip('tomopy')
+import autotune
+
+
+def test_block_is_a_multiple_of_the_workers():
+    assert autotune._block(100, 8) == 96
+    assert autotune._block(5, 8) == 5
+    assert autotune._block(8, 8) == 8
+
+
+def test_tuned_calibrates_once(tmp_path, monkeypatch):
+    calls = []
+
+    def calibrate(nproj, nslice, ncol, max_ncore=None, verbose=True):
+        calls.append(nslice)
+        return {'ncore': 4, 'nchunk': None, 'block': autotune._block(nslice, 4), 'slices_s': 1.0}
+
+    monkeypatch.setattr(autotune, 'calibrate', calibrate)
+    cache = str(tmp_path / 'autotune.json')
+    first = autotune.tuned(180, 30, 256, cache=cache)
+    # Same power of two of sinograms: read back, block fitted to nslice.
+    second = autotune.tuned(180, 27, 256, cache=cache)
+    assert calls == [30]
+    assert first['block'] == 28 and second['block'] == 24
+    autotune.tuned(180, 30, 256, cache=cache, force=True)
+    assert calls == [30, 30]
@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip('dxchange')
+pytest.importorskip('dxfile')
+import convert_manifest
+
+
+def test_expand_keeps_types_and_formats():
+    variables = {'index': 7, 'name': 'ti', 'cycle': '14100'}
+    obj = {'data_index': '{index}',
+           'output': '{name}_{cycle}C.h5',
+           'padded': 'proj_{index:04d}.hdf',
+           'list': ['{name}', 3]}
+    assert convert_manifest._expand(obj, variables) == {'data_index': 7,
+                                                        'output': 'ti_14100C.h5',
+                                                        'padded': 'proj_0007.hdf',
+                                                        'list': ['ti', 3]}
+
+
+def test_expand_leaves_other_braces():
+    text = 'set {a, b} of {name}, {unknown} and a lone { brace'
+    assert convert_manifest._expand(text, {'name': 'ti'}) == 'set {a, b} of ti, {unknown} and a lone { brace'
@@ -0,0 +1,150 @@
+import os
+import shutil
+
+import h5py
+import numpy as np
+import pytest
+
+pytest.importorskip('dxfile')
+import dxchecksum
+import dxconvert
+
+
+def test_chunk_shape_layouts():
+    shape = (1500, 2048, 2560)
+    assert dxconvert.chunk_shape(shape, 2, 'projection') == (1, 2048, 2560)
+    n0, band, n2 = dxconvert.chunk_shape(shape, 2, 'sinogram', chunk_bytes=64 * 1024 ** 2)
+    assert (n0, n2) == (1500, 2560) and 1 <= band <= 2048
+    a, b, c = dxconvert.chunk_shape(shape, 2, 'balanced', chunk_bytes=4 * 1024 ** 2)
+    assert a == b and c == 2560
+    assert a * b * c * 2 <= 4 * 1024 ** 2
+
+
+def test_chunk_shape_unicode_and_tuple():
+    assert dxconvert.chunk_shape((10, 20, 30), 2, u'projection') == (1, 20, 30)
+    assert dxconvert.chunk_shape((10, 20, 30), 2, [2, 4, 30]) == (2, 4, 30)
+
+
+def test_chunk_shape_unknown():
+    with pytest.raises(ValueError):
+        dxconvert.chunk_shape((10, 20, 30), 2, 'diagonal')
+
+
+def test_chunk_cache_holds_a_row_of_chunks(tmp_path):
+    fname = str(tmp_path / 'data.h5')
+    f = dxconvert.open_partial(fname, resume=False)
+    dset = dxconvert.create_dataset(f, 'data', (64, 32, 128), np.uint16, chunks=(64, 2, 128),
+                                    compression='gzip')
+    nbytes = dset.id.get_access_plist().get_chunk_cache()[1]
+    assert nbytes >= 64 * 32 * 128 * 2
+    data = np.arange(64 * 32 * 128, dtype=np.uint16).reshape(64, 32, 128)
+    for start in range(0, 64, 16):
+        dset[start:start + 16] = data[start:start + 16]
+        dxconvert.checkpoint(dset, start + 16, data[start:start + 16])
+        # Progress only moves once the chunks along the projections are complete.
+        assert dxconvert.resume_point(dset) == (64 if start == 48 else 0)
+    del dset
+    dxconvert.finish(f, fname)
+    with h5py.File(fname, 'r') as f:
+        np.testing.assert_array_equal(f['/exchange/data'][...], data)
+
+
+def _source(fname, shape, seed, **kwargs):
+    data = np.random.RandomState(seed).randint(0, 4000, shape).astype(np.uint16)
+    with h5py.File(fname, 'w') as f:
+        f.create_dataset('/exchange/data', data=data, **kwargs)
+    return data
+
+
+def test_ingest_copies_sources_concurrently(tmp_path):
+    # A contiguous source is read with plain file reads, a chunked one through h5py.
+    sources = [(str(tmp_path / 'proj.h5'), _source(str(tmp_path / 'proj.h5'), (37, 6, 10), 0)),
+               (str(tmp_path / 'flat.h5'), _source(str(tmp_path / 'flat.h5'), (5, 6, 10), 1, chunks=(1, 6, 10))),
+               (str(tmp_path / 'dark.h5'), _source(str(tmp_path / 'dark.h5'), (3, 6, 10), 2))]
+    fname = str(tmp_path / 'out.h5')
+    f = dxconvert.open_partial(fname, resume=False)
+    jobs = [(src, '/exchange/data', dxconvert.create_dataset(f, name, data.shape, data.dtype))
+            for name, (src, data) in zip(('data', 'data_white', 'data_dark'), sources)]
+    dxconvert.ingest(jobs, slab_size=4)
+    del jobs
+    dxconvert.finish(f, fname)
+    with h5py.File(fname, 'r') as f:
+        for name, (_, data) in zip(('data', 'data_white', 'data_dark'), sources):
+            np.testing.assert_array_equal(f['exchange'][name][...], data)
+            assert 'progress' not in f['exchange'][name].attrs
+            np.testing.assert_array_equal(f['checksums'][name][...], dxchecksum.entry_digests(data))
+
+
+def test_ingest_shape_mismatch(tmp_path):
+    src = str(tmp_path / 'proj.h5')
+    _source(src, (8, 6, 10), 0)
+    with h5py.File(str(tmp_path / 'out.h5'), 'w') as f:
+        dst = f.create_dataset('data', shape=(8, 6, 11), dtype=np.uint16)
+        with pytest.raises(ValueError):
+            dxconvert.ingest([(src, '/exchange/data', dst)])
+
+
+def test_link_dataset_and_materialize(tmp_path):
+    os.makedirs(str(tmp_path / 'series' / 'raw'))
+    src = str(tmp_path / 'series' / 'raw' / 'proj.h5')
+    data = _source(src, (9, 6, 10), 0)
+    fname = str(tmp_path / 'series' / 'linked.h5')
+    f = dxconvert.open_partial(fname, resume=False)
+    # A resumed conversion links again over a dangling link of an earlier run.
+    f.require_group('exchange')['data'] = h5py.ExternalLink('missing.h5', '/exchange/data')
+    dset = dxconvert.link_dataset(f, 'data', src, '/exchange/data')
+    assert dset.shape == data.shape
+    del dset
+    dxconvert.finish(f, fname)
+
+    # Links are relative, the series can move as a whole.
+    shutil.move(str(tmp_path / 'series'), str(tmp_path / 'moved'))
+    fname = str(tmp_path / 'moved' / 'linked.h5')
+    assert dxconvert.materialize(fname, slab_size=4, chunks='sinogram', compression='gzip') == ['data']
+    os.remove(str(tmp_path / 'moved' / 'raw' / 'proj.h5'))
+    with h5py.File(fname, 'r') as f:
+        dset = f['/exchange/data']
+        assert not getattr(dset, 'is_virtual', False)
+        assert dset.attrs['units'] == 'counts'
+        assert dset.chunks[0] == 9 and dset.compression == 'gzip'
+        np.testing.assert_array_equal(dset[...], data)
+    assert dxconvert.materialize(fname) == []
+
+
+def test_resume_after_interruption(tmp_path):
+    src = str(tmp_path / 'proj.h5')
+    data = _source(src, (20, 6, 10), 0)
+    fname = str(tmp_path / 'out.h5')
+    f = dxconvert.open_partial(fname)
+    f.create_group('measurement')
+    dst = dxconvert.create_dataset(f, 'data', data.shape, data.dtype)
+    dst[:8] = data[:8]
+    dxconvert.checkpoint(dst, 8, data[:8])
+    # Written but not checkpointed: redone on resume.
+    dst[8:12] = data[8:12]
+    del dst
+    f.close()
+    assert not os.path.exists(fname)
+
+    # The checkpointed projections are not read again.
+    with h5py.File(src, 'r+') as s:
+        s['/exchange/data'][:8] = 0
+    f = dxconvert.open_partial(fname)
+    assert list(f) == ['checksums', 'exchange']
+    dst = dxconvert.create_dataset(f, 'data', data.shape, data.dtype)
+    assert dxconvert.resume_point(dst) == 8
+    dxconvert.ingest([(src, '/exchange/data', dst)], slab_size=3)
+    del dst
+    dxconvert.finish(f, fname)
+    with h5py.File(fname, 'r') as f:
+        np.testing.assert_array_equal(f['/exchange/data'][...], data)
+        np.testing.assert_array_equal(f['/checksums/data'][...], dxchecksum.entry_digests(data))
+
+
+def test_unreadable_partial_file_starts_over(tmp_path):
+    fname = str(tmp_path / 'out.h5')
+    with open(fname + dxconvert.partial_suffix, 'wb') as fp:
+        fp.write(b'not hdf5')
+    f = dxconvert.open_partial(fname)
+    assert list(f) == []
+    f.close()
@@ -0,0 +1,58 @@
+import h5py
+import numpy as np
+
+import dxchecksum
+import dxverify
+
+
+def test_checksum_hex_round_trip():
+    data = np.arange(60, dtype=np.uint16).reshape(3, 4, 5)
+    digests = dxchecksum.entry_digests(data)
+    assert digests.shape == (3, dxchecksum.digest_size)
+    np.testing.assert_array_equal(dxchecksum.from_hex(dxchecksum.to_hex(digests)), digests)
+    assert dxchecksum.combine(digests) == dxchecksum.combine(digests.copy())
+    data[1, 0, 0] += 1
+    assert (dxchecksum.entry_digests(data)[1] != digests[1]).any()
+
+
+def test_chunks_of_every_axis():
+    assert dxverify._chunks_of(5, (1, 100, 200), (10, 100, 200)) == 'chunk (5, 0, 0)'
+    assert dxverify._chunks_of(5, (10, 4, 200), (10, 30, 200)) == 'chunks (0, 0-7, 0)'
+    assert dxverify._chunks_of(37, (8, 8, 1000), (40, 64, 2048)) == 'chunks (4, 0-7, 0-2)'
+
+
+def test_verify_finds_corrupted_entry(tmp_path):
+    fname = str(tmp_path / 'data.h5')
+    data = np.arange(8 * 6 * 5, dtype=np.uint16).reshape(8, 6, 5)
+    digests = dxchecksum.entry_digests(data)
+    with h5py.File(fname, 'w') as f:
+        f.create_dataset('/exchange/data', data=data, chunks=(8, 2, 5))
+        sums = f.create_group('checksums')
+        sums.attrs['algorithm'] = dxchecksum.algorithm
+        sums.create_dataset('data', data=digests)
+        sums['data'].attrs['digest'] = dxchecksum.combine(digests)
+    assert dxverify.verify_files([fname], workers=1) == {fname: []}
+
+    with h5py.File(fname, 'a') as f:
+        f['/exchange/data'][3, 0, 0] += 1
+    problems = dxverify.verify_files([fname], workers=1)[fname]
+    assert problems == ['data: entry 3, HDF5 chunks (0, 0-2, 0) corrupted']
+
+
+def test_verify_chunks_spanning_all_projections(tmp_path):
+    fname = str(tmp_path / 'data.h5')
+    data = np.arange(40 * 6 * 5, dtype=np.uint16).reshape(40, 6, 5)
+    digests = dxchecksum.entry_digests(data)
+    with h5py.File(fname, 'w') as f:
+        # Sinogram layout: a chunk holds more entries than a task.
+        f.create_dataset('/exchange/data', data=data, chunks=(40, 2, 5))
+        sums = f.create_group('checksums')
+        sums.attrs['algorithm'] = dxchecksum.algorithm
+        sums.create_dataset('data', data=digests)
+        sums['data'].attrs['digest'] = dxchecksum.combine(digests)
+        f['/exchange/data'][13, 5, 0] += 1
+        f['/exchange/data'][31, 0, 0] += 1
+    assert dxverify.verify_range(fname, 'data', 10, 35, dxchecksum.to_hex(digests[10:35]), block=4)[-1] == [13, 31]
+    problems = dxverify.verify_files([fname], workers=2, block=4)[fname]
+    assert sorted(problems) == ['data: entry 13, HDF5 chunks (0, 0-2, 0) corrupted',
+                                'data: entry 31, HDF5 chunks (0, 0-2, 0) corrupted']
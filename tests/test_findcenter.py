@@ -0,0 +1,46 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+pytest.importorskip('tomopy')
+pytest.importorskip('dxchange')
+import findcenter
+
+
+@pytest.mark.parametrize('offset', [-7, 0, 4.5, 12])
+def test_center_from_projections_shifted_phantom(offset):
+    nrow, ncol = 16, 256
+    center = (ncol - 1) / 2. + offset
+    x = np.arange(ncol, dtype=float)
+
+    def profile(x):
+        # A few bumps, off center so that the mirror differs.
+        return (np.exp(-((x - 60) / 9.) ** 2) + 0.5 * np.exp(-((x - 150) / 20.) ** 2)
+                + 0.8 * np.exp(-((x - 100) / 4.) ** 2))
+
+    rows = np.linspace(0.5, 1.5, nrow)[:, np.newaxis]
+    proj0 = rows * profile(x)
+    # At 180 degrees a column x sees what column 2 * center - x saw at 0.
+    proj180 = rows * profile(2 * center - x)
+    assert abs(findcenter.center_from_projections(proj0, proj180) - center) <= 0.5
+
+
+def test_cached_center_depends_on_search_settings(tmp_path, monkeypatch):
+    fname = str(tmp_path / 'data.h5')
+    with h5py.File(fname, 'w') as f:
+        f.create_dataset('/exchange/data', shape=(4, 8, 64), dtype='uint16')
+    monkeypatch.setattr(findcenter, 'cache_fname', str(tmp_path / 'centers.json'))
+    stat = os.stat(fname)
+    findcenter._write_cache({'data': {'center': 30.5,
+                                      'file': [os.path.abspath(fname), stat.st_size, int(stat.st_mtime)],
+                                      'settings': {'row': 4, 'level': 2, 'radius': 10.0}}})
+
+    def read_aps_32id(*args, **kwargs):
+        raise RuntimeError('searched again')
+
+    monkeypatch.setattr(findcenter.dxchange, 'read_aps_32id', read_aps_32id, raising=False)
+    assert findcenter.find_center(fname, radius=10.0) == 30.5
+    with pytest.raises(RuntimeError):
+        findcenter.find_center(fname, radius=20.0)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+tomopy = pytest.importorskip('tomopy')
+h5py = pytest.importorskip('h5py')
+import recpipe
+
+
+def _raw(shape=(30, 6, 40), seed=0):
+    rs = np.random.RandomState(seed)
+    flat = rs.uniform(900, 1100, (4,) + shape[1:]).astype(np.uint16)
+    dark = rs.uniform(90, 110, (3,) + shape[1:]).astype(np.uint16)
+    proj = rs.uniform(200, 800, shape).astype(np.uint16)
+    return proj, flat, dark
+
+
+def test_normalize_log_matches_tomopy():
+    proj, flat, dark = _raw()
+    expected = tomopy.minus_log(tomopy.normalize(proj, flat, dark))
+    out = recpipe.normalize_log(proj, flat, dark)
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_normalize_in_place_and_out():
+    proj, flat, dark = _raw()
+    expected = tomopy.normalize(proj, flat, dark)
+    out = np.empty(proj.shape, dtype=np.float32)
+    assert recpipe.normalize(proj, flat, dark, out=out) is out
+    np.testing.assert_allclose(out, expected, rtol=1e-5)
+    data = proj.astype(np.float32)
+    assert recpipe.normalize(data, flat, dark) is data
+
+
+def test_pipeline_memory_grows_with_block_and_workers():
+    shape = (1500, 2048, 2560)
+    args = (shape, 20, 10, 2)
+    for phase in (False, True):
+        costs = [recpipe.pipeline_memory(*args, block=b, ncore=4, halo=25, phase=phase) for b in (1, 8, 64, 512)]
+        assert costs == sorted(costs)
+        costs = [recpipe.pipeline_memory(*args, block=64, ncore=n, halo=25, phase=phase) for n in (1, 4, 16)]
+        assert costs == sorted(costs)
+    assert recpipe.pipeline_memory(*args, block=64, halo=25, phase=True) > \
+        recpipe.pipeline_memory(*args, block=64, halo=25, phase=False)
+
+
+@pytest.fixture
+def dxfile(tmp_path):
+    fname = str(tmp_path / 'data.h5')
+    with h5py.File(fname, 'w') as f:
+        f.create_dataset('/exchange/data', shape=(360, 256, 512), dtype='uint16')
+        f.create_dataset('/exchange/data_white', shape=(10, 256, 512), dtype='uint16')
+        f.create_dataset('/exchange/data_dark', shape=(10, 256, 512), dtype='uint16')
+    return fname
+
+
+def test_plan_blocks_fits_budget(dxfile):
+    budget = 2 * 1024 ** 3
+    previous = 0
+    for memory in (budget // 4, budget // 2, budget):
+        block, ncore = recpipe.plan_blocks(dxfile, memory, fraction=1.0, ncore=8)
+        cost = recpipe.pipeline_memory((360, 256, 512), 10, 10, 2, block, ncore)
+        assert cost <= memory
+        assert block >= previous
+        previous = block
+        if block < 256:
+            assert recpipe.pipeline_memory((360, 256, 512), 10, 10, 2, block + 1, ncore) > memory
+
+
+def test_plan_blocks_too_small(dxfile):
+    with pytest.raises(MemoryError):
+        recpipe.plan_blocks(dxfile, 1024, ncore=1)
@@ -0,0 +1,44 @@
+import os
+import time
+
+import numpy as np
+
+import sinocache
+
+
+def test_store_load_round_trip(tmp_path):
+    cache = sinocache.SinoCache(str(tmp_path))
+    data = np.arange(24, dtype=np.float32).reshape(2, 3, 4)
+    theta = np.linspace(0, np.pi, 2)
+    cache.store('k', data=data, theta=theta)
+    hit = cache.load('k')
+    np.testing.assert_array_equal(hit['data'], data)
+    np.testing.assert_array_equal(hit['theta'], theta)
+    assert cache.load('missing') is None
+
+
+def test_key_depends_on_file_range_and_params(tmp_path):
+    cache = sinocache.SinoCache(str(tmp_path / 'cache'))
+    fname = str(tmp_path / 'raw.bin')
+    with open(fname, 'wb') as fp:
+        fp.write(b'raw data')
+    key = cache.key(fname, (0, 8), {'alpha': 1})
+    assert key == cache.key(fname, (0, 8), {'alpha': 1})
+    assert key != cache.key(fname, (8, 16), {'alpha': 1})
+    assert key != cache.key(fname, (0, 8), {'alpha': 2})
+
+
+def test_evicts_least_recently_used(tmp_path):
+    entry = np.zeros(1000)
+    cache = sinocache.SinoCache(str(tmp_path), budget=int(3.5 * entry.nbytes) + 1000)
+    for key in ('a', 'b', 'c'):
+        cache.store(key, data=entry)
+        time.sleep(0.02)
+    # Using a makes b the least recently used.
+    assert cache.load('a') is not None
+    time.sleep(0.02)
+    cache.store('d', data=entry)
+    assert cache.load('b') is None
+    assert not os.path.exists(str(tmp_path / 'b'))
+    for key in ('a', 'c', 'd'):
+        assert cache.load(key) is not None
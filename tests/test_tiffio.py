@@ -0,0 +1,77 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+tifffile = pytest.importorskip('tifffile')
+pytest.importorskip('dxfile')
+import dxconvert
+import tiffio
+
+_imwrite = getattr(tifffile, 'imwrite', None) or tifffile.imsave
+
+
+def _stack(n, nrow=40, ncol=24, seed=0):
+    return np.random.RandomState(seed).randint(0, 60000, (n, nrow, ncol)).astype(np.uint16)
+
+
+image = np.arange(40 * 24, dtype=np.uint16).reshape(40, 24)
+
+layouts = {'contiguous': {},
+           'strips': {'rowsperstrip': 7},
+           'compressed': {'compression': 'zlib', 'rowsperstrip': 7},
+           'tiled': {'tile': (16, 16)}}
+
+
+@pytest.mark.parametrize('layout', sorted(layouts))
+@pytest.mark.parametrize('sino', [(0, 40), (3, 17), (14, 15), (33, 40)])
+def test_read_rows(tmp_path, layout, sino):
+    fname = str(tmp_path / 'image.tif')
+    _imwrite(fname, image, **layouts[layout])
+    np.testing.assert_array_equal(tiffio.read_rows(fname, sino), image[slice(*sino)])
+    out = np.zeros((sino[1] - sino[0], 24), dtype=np.uint16)
+    assert tiffio.read_rows(fname, sino, out) is out
+    np.testing.assert_array_equal(out, image[slice(*sino)])
+
+
+def test_read_stack_anka(tmp_path):
+    stacks = {'radios': _stack(9), 'flats': _stack(3, seed=1), 'darks': _stack(2, seed=2)}
+    for folder, stack in stacks.items():
+        os.makedirs(str(tmp_path / folder))
+        for i, frame in enumerate(stack):
+            _imwrite(str(tmp_path / folder / 'image_{:05d}.tif'.format(i + 10)), frame)
+    fnames = tiffio.anka_fnames(str(tmp_path), range(10, 19), range(10, 13), range(10, 12))
+    for names, folder in zip(fnames, ('radios', 'flats', 'darks')):
+        assert tiffio.stack_shape(names) == (stacks[folder].shape, np.dtype(np.uint16))
+        np.testing.assert_array_equal(tiffio.read_stack(names, workers=3), stacks[folder])
+    # Projections in reverse order, into a preallocated stack.
+    out = np.zeros((9, 40, 24), dtype=np.uint16)
+    assert tiffio.read_stack(fnames[0][::-1], out=out) is out
+    np.testing.assert_array_equal(out, stacks['radios'][::-1])
+
+
+def test_stream_stack_tomcat_rows(tmp_path):
+    proj, flat, dark = _stack(10), _stack(2, seed=1), _stack(3, seed=2)
+    prefix = str(tmp_path / 'sample')
+    with open(prefix + '.log', 'w') as fp:
+        fp.write('Number of projections : 10\nNumber of flats : 2\nNumber of darks : 3\n')
+    for i, frame in enumerate(np.concatenate((dark, flat, proj))):
+        _imwrite(prefix + '{:04d}.tif'.format(i + 1), frame, rowsperstrip=8)
+    fnames = tiffio.tomcat_fnames(prefix)
+    assert [len(names) for names in fnames] == [10, 2, 3]
+    assert tiffio.tomcat_fnames(prefix, proj=(2, 5))[0] == fnames[0][2:5]
+
+    sino = (5, 20)
+    fname = str(tmp_path / 'out.h5')
+    f = dxconvert.open_partial(fname, resume=False)
+    for names, name in zip(fnames, ('data', 'data_white', 'data_dark')):
+        shape, dtype = tiffio.stack_shape(names, sino)
+        assert shape == (len(names), 15, 24)
+        dst = dxconvert.create_dataset(f, name, shape, dtype)
+        tiffio.stream_stack(names, dst, block=4, workers=2, sino=sino)
+        del dst
+    dxconvert.finish(f, fname)
+    with h5py.File(fname, 'r') as f:
+        for name, stack in zip(('data', 'data_white', 'data_dark'), (proj, flat, dark)):
+            np.testing.assert_array_equal(f['exchange'][name][...], stack[:, 5:20])
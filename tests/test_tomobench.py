@@ -0,0 +1,26 @@
+import h5py
+import numpy as np
+import pytest
+
+pytest.importorskip('tomopy')
+pytest.importorskip('dxchange')
+pytest.importorskip('dxfile')
+import tomobench
+
+
+def test_synthetic_projections_are_reproducible():
+    proj, flat, dark = tomobench.synthetic_projections(12, 3, 32, nflat=2, ndark=1)
+    assert (proj.shape, flat.shape, dark.shape) == ((12, 3, 32), (2, 3, 32), (1, 3, 32))
+    assert proj.dtype == flat.dtype == dark.dtype == np.uint16
+    # The discs absorb: projections are below the flat field on average.
+    assert proj.mean() < flat.mean() and dark.mean() < proj.mean()
+    again = tomobench.synthetic_projections(12, 3, 32, nflat=2, ndark=1)
+    for a, b in zip((proj, flat, dark), again):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_elettra_writer_stores_sinogram_order(tmp_path):
+    proj, flat, dark = tomobench.synthetic_projections(6, 2, 16, nflat=2, ndark=2)
+    source = tomobench.write_elettra(str(tmp_path), proj, flat, dark)
+    with h5py.File(source['native'], 'r') as f:
+        np.testing.assert_array_equal(f['/exchange/data'][()], np.swapaxes(proj, 0, 1))
@@ -0,0 +1,34 @@
+import threading
+import time
+
+import numpy as np
+
+import tomoprof
+
+
+def test_stage_summary_and_thread_cpu():
+    with tomoprof.profiling(label='test') as prof:
+        def read():
+            with tomoprof.stage('read') as st:
+                time.sleep(0.2)
+                st.output(np.zeros(10, dtype=np.uint8))
+
+        t = threading.Thread(target=read)
+        t.start()
+        with tomoprof.stage('compute'):
+            end = time.time() + 0.2
+            while time.time() < end:
+                sum(range(1000))
+        t.join()
+    rows = dict((r['stage'], r) for r in prof.summary())
+    # The waiting thread is not charged the busy loop of the main thread.
+    assert rows['read']['bound'] == 'io'
+    assert rows['compute']['bound'] == 'compute'
+    assert rows['read']['bytes_out'] == 10
+    assert all(r['rss_growth'] >= 0 for r in rows.values())
+
+
+def test_stage_without_profiler():
+    with tomoprof.stage('idle') as st:
+        st.output(np.zeros(10, dtype=np.uint8))
+    assert tomoprof._active is None
@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip('tomopy')
+pytest.importorskip('dxchange')
+pytest.importorskip('dxfile')
+import tomoregress
+
+
+def test_compare_flags_throughput_and_memory():
+    baseline = {'a': {'mb_s': 100.0, 'rss_growth': 1e8},
+                'b': {'mb_s': 100.0, 'rss_growth': 1e8}}
+    results = {'a': {'mb_s': 70.0, 'rss_growth': 0.9e8},
+               'b': {'mb_s': 140.0, 'rss_growth': 1.5e8},
+               'c': {'mb_s': 10.0, 'rss_growth': 1e6}}
+    status = dict((row[:2], row[-1]) for row in tomoregress.compare(baseline, results))
+    assert status == {('a', 'mb_s'): 'REGRESSED', ('a', 'rss_growth'): 'ok',
+                      ('b', 'mb_s'): 'improved', ('b', 'rss_growth'): 'REGRESSED',
+                      ('c', 'mb_s'): 'new', ('c', 'rss_growth'): 'new'}
+    rows = tomoregress.compare(baseline, results, memory_tolerance=1.0)
+    assert [row[-1] for row in rows if row[:2] == ('b', 'rss_growth')] == ['ok']
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Parallel readers for directories of tiff images
+"""
+
+from __future__ import print_function
+
+import os
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import tifffile
+
+import dxconvert
+
+__all__ = ['anka_fnames',
+           'tomcat_fnames',
+           'stack_shape',
+           'read_rows',
+           'read_stack',
+           'stream_stack']
+
+
+def anka_fnames(fname, ind_tomo, ind_flat, ind_dark):
+    """
+    File names of the projections, flat and dark fields of an Anka
+    TopoTomo directory, as read by dxchange.read_anka_topotomo.
+
+    Parameters
+    ----------
+    fname : str
+        Directory holding the radios, flats and darks folders.
+    ind_tomo, ind_flat, ind_dark : list of int
+        Indices of the projection, flat and dark images.
+
+    Returns
+    -------
+    tuple of list
+        Projection, flat and dark file names.
+    """
+    fname = os.path.abspath(fname)
+
+    def names(folder, ind):
+        return [os.path.join(fname, folder, 'image_{:05d}.tif'.format(i)) for i in ind]
+
+    return names('radios', ind_tomo), names('flats', ind_flat), names('darks', ind_dark)
+
+
+def tomcat_fnames(fname, ind_tomo=None, proj=None):
+    """
+    File names of the projections, flat and dark fields of an SLS TOMCAT
+    acquisition, as read by dxchange.read_sls_tomcat.
+
+    The numbers of darks, flats and projections are read from the
+    <fname>.log file; images are <fname>NNNN.tif with the darks first,
+    then the flats, then the projections.
+
+    Parameters
+    ----------
+    fname : str
+        Acquisition prefix.
+    ind_tomo : list of int, optional
+        Indices of the projection images.
+    proj : tuple, optional
+        (start, end) of the projections to read.
+
+    Returns
+    -------
+    tuple of list
+        Projection, flat and dark file names.
+    """
+    fname = os.path.abspath(fname)
+    nproj = nflat = ndark = 0
+    with open(fname + '.log', 'r') as contents:
+        for line in contents:
+            ls = line.split()
+            if len(ls) > 4 and ls[0] == 'Number':
+                if ls[2] == 'projections':
+                    nproj = int(ls[4])
+                elif ls[2] == 'flats':
+                    nflat = int(ls[4])
+                elif ls[2] == 'darks':
+                    ndark = int(ls[4])
+    dark_start = 1
+    flat_start = dark_start + ndark
+    proj_start = flat_start + nflat
+    if ind_tomo is None:
+        ind_tomo = list(range(proj_start, proj_start + nproj))
+    if proj is not None:
+        ind_tomo = ind_tomo[slice(*proj)]
+
+    def names(ind):
+        return [fname + '{:04d}.tif'.format(i) for i in ind]
+
+    return (names(ind_tomo),
+            names(range(flat_start, flat_start + nflat)),
+            names(range(dark_start, dark_start + ndark)))
+
+
+def _rows(sino):
+    return slice(None) if sino is None else slice(*sino)
+
+
+def stack_shape(fnames, sino=None):
+    """
+    Shape and dtype of the stack made of the images in fnames, keeping
+    only the detector rows in sino=(start, end) when given.
+    """
+    with tifffile.TiffFile(fnames[0]) as tif:
+        page = tif.pages[0]
+        nrow, ncol = page.shape
+        nrow = len(range(nrow)[_rows(sino)])
+        return (len(fnames), nrow, ncol), np.dtype(page.dtype)
+
+
+def _contiguous_offset(page):
+    # Older tifffile versions give (offset, bytecount) of the contiguous
+    # image data, or None; newer ones a bool, the offset being that of
+    # the first strip.
+    contiguous = page.is_contiguous
+    if not contiguous:
+        return None
+    if contiguous is True:
+        return page.dataoffsets[0]
+    return contiguous[0]
+
+
+def read_rows(fname, sino, out=None):
+    """
+    Read the detector rows sino=(start, end) of a tiff image touching
+    only the bytes that hold them.
+
+    Uncompressed images stored contiguously are memory mapped; other
+    uncompressed strip images are read strip by strip, and compressed
+    strips are decoded one at a time when tifffile supports it. Tiled
+    images, and compressed ones with older tifffile versions, are fully
+    decoded.
+
+    Parameters
+    ----------
+    fname : str
+        Image file name.
+    sino : tuple
+        (start, end) of the rows to read.
+    out : ndarray, optional
+        Preallocated (end - start, columns) output.
+
+    Returns
+    -------
+    ndarray
+        The rows.
+    """
+    with tifffile.TiffFile(fname) as tif:
+        page = tif.pages[0]
+        nrow, ncol = page.shape
+        r0, r1, _ = _rows(sino).indices(nrow)
+        if out is None:
+            out = np.empty((r1 - r0, ncol), dtype=page.dtype)
+        dtype = np.dtype(page.dtype).newbyteorder(tif.byteorder)
+        simple = (not page.is_tiled and len(page.dataoffsets) > 0 and
+                  getattr(page, 'samplesperpixel', 1) == 1)
+        uncompressed = int(page.compression) == 1
+        offset = _contiguous_offset(page) if simple and uncompressed else None
+        if offset is not None:
+            image = np.memmap(fname, dtype=dtype, mode='r', offset=offset, shape=(nrow, ncol))
+            np.copyto(out, image[r0:r1])
+            del image
+            return out
+        if simple and (uncompressed or hasattr(page, 'decode')):
+            rps = min(page.rowsperstrip, nrow)
+            fh = tif.filehandle
+            for strip in range(r0 // rps, (r1 - 1) // rps + 1):
+                fh.seek(page.dataoffsets[strip])
+                data = fh.read(page.databytecounts[strip])
+                if uncompressed:
+                    rows = np.frombuffer(data, dtype=dtype).reshape(-1, ncol)
+                else:
+                    rows = page.decode(data, strip)[0].reshape(-1, ncol)
+                s0 = strip * rps
+                a, b = max(r0, s0), min(r1, s0 + rows.shape[0])
+                out[a - r0:b - r0] = rows[a - s0:b - s0]
+            return out
+    out[...] = tifffile.imread(fname)[r0:r1]
+    return out
+
+
+def _read_image(fname, out, sino=None):
+    if sino is None:
+        tifffile.imread(fname, out=out)
+    else:
+        read_rows(fname, sino, out)
+
+
+def read_stack(fnames, out=None, workers=None, sino=None):
+    """
+    Decode tiff images into a stack using a pool of threads.
+
+    Each file is decoded straight into its slice of the output; tifffile
+    releases the GIL while reading and decompressing, so open/decode
+    latencies of different files overlap.
+
+    Parameters
+    ----------
+    fnames : list of str
+        Image file names.
+    out : ndarray, optional
+        Preallocated (len(fnames), rows, columns) output.
+    workers : int, optional
+        Number of threads. Defaults to twice the number of CPUs.
+    sino : tuple, optional
+        (start, end) of the detector rows to keep.
+
+    Returns
+    -------
+    ndarray
+        The stack.
+    """
+    if out is None:
+        shape, dtype = stack_shape(fnames, sino)
+        out = np.empty(shape, dtype=dtype)
+    if workers is None:
+        workers = 2 * multiprocessing.cpu_count()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for r in [pool.submit(_read_image, fname, out[i], sino) for i, fname in enumerate(fnames)]:
+            r.result()
+    return out
+
+
+def stream_stack(fnames, dst, block=32, workers=None, sino=None):
+    """
+    Decode tiff images block by block into an h5py dataset.
+
+    Block N+1 is decoded by the thread pool while block N is written, so
+    memory stays at two blocks whatever the number of images.
+
+    Parameters
+    ----------
+    fnames : list of str
+        Image file names.
+    dst : h5py.Dataset
+        Preallocated (len(fnames), rows, columns) destination.
+    block : int
+        Number of images per block.
+    workers : int, optional
+        Number of decoding threads. Defaults to twice the number of CPUs.
+    sino : tuple, optional
+        (start, end) of the detector rows to keep.
+
+    Writes into a partial file resume after the last checkpoint, see
+    dxconvert.open_partial.
+    """
+    shape, dtype = stack_shape(fnames, sino)
+    if shape != dst.shape:
+        raise ValueError('shape mismatch: {} != {}'.format(shape, dst.shape))
+    if workers is None:
+        workers = 2 * multiprocessing.cpu_count()
+    block = max(1, min(block, len(fnames)))
+    buffers = [np.empty((block,) + shape[1:], dtype=dtype) for _ in range(2)]
+    starts = list(range(dxconvert.resume_point(dst), len(fnames), block))
+    if not starts:
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+
+        def submit(k):
+            start = starts[k]
+            end = min(start + block, len(fnames))
+            buf = buffers[k % 2]
+            return [pool.submit(_read_image, fnames[i], buf[i - start], sino) for i in range(start, end)]
+
+        pending = submit(0)
+        for k, start in enumerate(starts):
+            for r in pending:
+                r.result()
+            end = min(start + block, len(fnames))
+            if k + 1 < len(starts):
+                pending = submit(k + 1)
+            with dxconvert.io_throttle():
+                dst.write_direct(buffers[k % 2], np.s_[0:end - start], np.s_[start:end])
+            dxconvert.checkpoint(dst, end, buffers[k % 2][:end - start])
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark conversion and reconstruction on synthetic beamline-like datasets
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+
+import numpy as np
+import h5py
+import tifffile
+
+import convert_manifest
+import recpipe
+
+__all__ = ['sizes',
+           'layouts',
+           'synthetic_projections',
+           'write_aps_2bm',
+           'write_anka',
+           'write_tomcat',
+           'write_elettra',
+           'run_benchmark',
+           'run_isolated',
+           'run_suite',
+           'machine']
+
+# (projections, rows, columns) of the preset sizes.
+sizes = {'small': (180, 32, 256),
+         'medium': (720, 128, 1024),
+         'large': (1500, 256, 2048)}
+
+layouts = ['aps_2bm', 'anka', 'tomcat', 'elettra']
+
+_imwrite = getattr(tifffile, 'imwrite', None) or tifffile.imsave
+
+
+def synthetic_projections(nproj, nrow, ncol, nflat=10, ndark=10, seed=0):
+    """
+    Raw uint16 projections, flat and dark fields of a stack of discs.
+
+    The object is a few absorbing discs, different on every detector row,
+    centered on the rotation axis at column (ncol - 1) / 2. The beam
+    profile has column to column gain variations, which leave stripes
+    in the sinograms, and the counts have Poisson noise.
+
+    Returns
+    -------
+    tuple of ndarray
+        proj (nproj, nrow, ncol), flat (nflat, nrow, ncol) and dark
+        (ndark, nrow, ncol).
+    """
+    rs = np.random.RandomState(seed)
+    theta = np.linspace(0, np.pi, nproj, endpoint=False)
+    s = np.arange(ncol) - (ncol - 1) / 2.0
+    gain = 1 + 0.02 * rs.standard_normal(ncol)
+    beam = 4000 * gain[np.newaxis, :] * np.ones((nrow, 1))
+    dark_level = 100
+
+    # Discs: center, radius and attenuation per row, in pixels and 1/pixel.
+    ndisc = 4
+    x0 = rs.uniform(-0.3, 0.3, (nrow, ndisc)) * ncol
+    y0 = rs.uniform(-0.3, 0.3, (nrow, ndisc)) * ncol
+    r = rs.uniform(0.05, 0.15, (nrow, ndisc)) * ncol
+    mu = rs.uniform(0.5, 2.0, (nrow, ndisc)) / ncol
+
+    proj = np.empty((nproj, nrow, ncol), dtype=np.uint16)
+    for i, t in enumerate(theta):
+        # Distance of each disc center from the ray through s.
+        d = s[np.newaxis, np.newaxis, :] - (x0 * np.cos(t) + y0 * np.sin(t))[:, :, np.newaxis]
+        chord = 2 * np.sqrt(np.clip(r[:, :, np.newaxis] ** 2 - d ** 2, 0, None))
+        counts = beam * np.exp(-(mu[:, :, np.newaxis] * chord).sum(axis=1)) + dark_level
+        proj[i] = np.clip(rs.poisson(counts), 0, 65535)
+    flat = np.clip(rs.poisson(beam + dark_level, (nflat, nrow, ncol)), 0, 65535).astype(np.uint16)
+    dark = np.clip(rs.poisson(dark_level, (ndark, nrow, ncol)), 0, 65535).astype(np.uint16)
+    return proj, flat, dark
+
+
+def _hdf(fname, data):
+    with h5py.File(fname, 'w') as f:
+        f.create_dataset('/exchange/data', data=data)
+        f.create_dataset('/file_creation_datetime', data=np.array([[b'2017-01-01T00:00:00']]))
+
+
+def write_aps_2bm(path, proj, flat, dark):
+    """
+    Write proj_0001.hdf, proj_0002.hdf and proj_0003.hdf as the APS 2-BM
+    projection, flat and dark files; returns the convert_manifest source keys.
+    """
+    for i, data in enumerate((proj, flat, dark)):
+        _hdf(os.path.join(path, 'proj_{:04d}.hdf'.format(i + 1)), data)
+    return {'directory': path, 'data_index': 1}
+
+
+def write_anka(path, proj, flat, dark):
+    """
+    Write radios, flats and darks directories of image_NNNNN.tif files as
+    Anka TopoTomo; returns the convert_manifest source keys.
+    """
+    for folder, data in (('radios', proj), ('flats', flat), ('darks', dark)):
+        os.makedirs(os.path.join(path, folder))
+        for i, image in enumerate(data):
+            _imwrite(os.path.join(path, folder, 'image_{:05d}.tif'.format(i)), image)
+    return {'directory': path,
+            'proj_range': [0, proj.shape[0]],
+            'flat_range': [0, flat.shape[0]],
+            'dark_range': [0, dark.shape[0]]}
+
+
+def write_tomcat(path, proj, flat, dark):
+    """
+    Write <prefix>.log and <prefix>NNNN.tif files, darks first, then flats,
+    then projections, as SLS TOMCAT; returns the convert_manifest source keys.
+    """
+    prefix = os.path.join(path, 'sample')
+    with open(prefix + '.log', 'w') as fp:
+        fp.write('Number of projections : {}\n'.format(proj.shape[0]))
+        fp.write('Number of flats : {}\n'.format(flat.shape[0]))
+        fp.write('Number of darks : {}\n'.format(dark.shape[0]))
+    i = 1
+    for data in (dark, flat, proj):
+        for image in data:
+            _imwrite(prefix + '{:04d}.tif'.format(i), image)
+            i += 1
+    return {'prefix': prefix}
+
+
+def write_elettra(path, proj, flat, dark):
+    """
+    Write a native file with the projections, flat and dark fields in
+    sinogram order, as Elettra Syrmep; returns the convert_manifest source keys.
+    """
+    fname = os.path.join(path, 'native.h5')
+    with h5py.File(fname, 'w') as f:
+        for name, data in (('data', proj), ('data_white', flat), ('data_dark', dark)):
+            f.create_dataset('/exchange/' + name, data=np.ascontiguousarray(np.swapaxes(data, 0, 1)))
+    return {'native': fname}
+
+
+writers = {'aps_2bm': write_aps_2bm,
+           'anka': write_anka,
+           'tomcat': write_tomcat,
+           'elettra': write_elettra}
+
+
+def machine():
+    """
+    Description of the machine and software running the benchmarks.
+    """
+    return {'host': socket.gethostname(),
+            'cpus': multiprocessing.cpu_count(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'h5py': h5py.__version__}
+
+
+def run_benchmark(layout, shape, workdir, block=32):
+    """
+    Generate a synthetic dataset in layout, convert it with
+    convert_manifest and reconstruct it with recpipe.reconstruct_volume.
+
+    Run it in a process of its own, see run_suite, so that the peak
+    resident memory is that of this benchmark alone.
+
+    Parameters
+    ----------
+    layout : str
+        One of layouts.
+    shape : tuple
+        (projections, rows, columns).
+    workdir : str
+        Scratch directory, emptied on return.
+    block : int
+        Sinograms per reconstruction block.
+
+    Returns
+    -------
+    dict
+        Sizes, times and throughputs of the conversion and reconstruction.
+    """
+    nproj, nrow, ncol = shape
+    raw_dir = os.path.join(workdir, 'raw')
+    os.makedirs(raw_dir)
+    try:
+        proj, flat, dark = synthetic_projections(nproj, nrow, ncol)
+        source = writers[layout](raw_dir, proj, flat, dark)
+        nbytes = proj.nbytes + flat.nbytes + dark.nbytes
+        del proj, flat, dark
+
+        output = os.path.join(workdir, 'converted.h5')
+        ds = dict(source, name=layout, format=layout, output=output,
+                  metadata={'sample': {'name': {'value': 'synthetic ' + layout}}})
+        t = time.time()
+        convert_manifest.convert_dataset(ds)
+        convert = time.time() - t
+
+        t = time.time()
+        recpipe.reconstruct_volume(output, (ncol - 1) / 2.0, os.path.join(workdir, 'rec', 'rec'),
+                                   block=block, halo=0, tune=False,
+                                   profile=os.path.join(workdir, 'profile.json'))
+        recon = time.time() - t
+        with open(os.path.join(workdir, 'profile.json')) as fp:
+            stages = dict((r['stage'], r['wall']) for r in json.load(fp)['stages'])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {'layout': layout,
+            'shape': list(shape),
+            'bytes': nbytes,
+            'convert_s': convert,
+            'convert_mb_s': nbytes / 1e6 / max(convert, 1e-9),
+            'recon_s': recon,
+            'recon_slices_s': nrow / max(recon, 1e-9),
+            'stages_s': stages,
+            'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+
+def run_isolated(func, *args):
+    """
+    Return func(*args) run in a fresh process, so that the peak resident
+    memory it reports is its own.
+    """
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        return pool.apply(func, args)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def run_suite(layouts, shape, workdir=None, block=32, repeat=1):
+    """
+    Run run_benchmark for every layout, each time in a fresh process,
+    and keep the fastest of repeat runs.
+
+    Returns
+    -------
+    dict
+        'machine' and, per layout, the result of its fastest run.
+    """
+    base = tempfile.mkdtemp(dir=workdir)
+    results = {}
+    try:
+        for layout in layouts:
+            best = None
+            for k in range(repeat):
+                res = run_isolated(run_benchmark, layout, shape, os.path.join(base, '{}_{}'.format(layout, k)), block)
+                if best is None or res['convert_s'] + res['recon_s'] < best['convert_s'] + best['recon_s']:
+                    best = res
+            results[layout] = best
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+    return {'machine': machine(), 'results': results}
+
+
+def _show(suite):
+    print ("{:10s} {:>18s} {:>10s} {:>12s} {:>10s} {:>12s} {:>10s}".format(
+        'layout', 'shape', 'convert s', 'convert MB/s', 'recon s', 'slices/s', 'rss MB'))
+    for layout in sorted(suite['results']):
+        r = suite['results'][layout]
+        print ("{:10s} {:>18s} {:10.2f} {:12.1f} {:10.2f} {:12.1f} {:10.1f}".format(
+            layout, 'x'.join(str(n) for n in r['shape']), r['convert_s'], r['convert_mb_s'],
+            r['recon_s'], r['recon_slices_s'], r['peak_rss'] / 1e6))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', default='small', choices=sorted(sizes), help='preset dataset size')
+    parser.add_argument('--shape', default=None, help='projections,rows,columns; overrides --size')
+    parser.add_argument('--layouts', default=','.join(layouts), help='comma separated raw data layouts')
+    parser.add_argument('--block', type=int, default=32, help='sinograms per reconstruction block')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per layout; the fastest is kept')
+    parser.add_argument('--workdir', default=None, help='scratch directory (default: system temporary directory)')
+    parser.add_argument('--output', default=None, help='JSON file receiving the results')
+    parser.add_argument('--save-baseline', default=None,
+                        help='JSON baseline file to create or update with these results, keyed by size')
+    args = parser.parse_args()
+
+    shape = tuple(int(n) for n in args.shape.split(',')) if args.shape else sizes[args.size]
+    key = args.shape or args.size
+    suite = run_suite(args.layouts.split(','), shape, args.workdir, args.block, args.repeat)
+    suite['size'] = key
+    _show(suite)
+
+    if args.output is not None:
+        with open(args.output, 'w') as fp:
+            json.dump(suite, fp, indent=2, sort_keys=True)
+    if args.save_baseline is not None:
+        baseline = {}
+        if os.path.isfile(args.save_baseline):
+            with open(args.save_baseline) as fp:
+                baseline = json.load(fp)
+        baseline[key] = suite
+        with open(args.save_baseline, 'w') as fp:
+            json.dump(baseline, fp, indent=2, sort_keys=True)
+        print ("Baseline saved: ", args.save_baseline)
+    sys.exit(0)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Stage timings of the conversion and reconstruction pipelines
+"""
+
+from __future__ import print_function
+
+import os
+import csv
+import json
+import time
+import resource
+import threading
+import contextlib
+
+__all__ = ['Profiler',
+           'profiling',
+           'stage',
+           'nbytes',
+           'current_rss',
+           'reset_peak_rss',
+           'peak_rss']
+
+# Profiler collecting the stages, set by profiling.
+_active = None
+
+# Columns of the per stage summary.
+fields = ['stage', 'calls', 'wall', 'cpu', 'cpu_ratio', 'bytes_in', 'bytes_out',
+          'mb_per_s', 'rss_growth', 'bound']
+
+
+def nbytes(*arrays):
+    """
+    Total size of the arrays among the arguments; anything else counts 0.
+    """
+    return sum(int(getattr(a, 'nbytes', 0)) for a in arrays)
+
+
+def _cpu_time():
+    t = os.times()
+    return t[0] + t[1]
+
+
+if hasattr(time, 'thread_time'):
+    _thread_cpu_time = time.thread_time
+elif hasattr(resource, 'RUSAGE_THREAD'):
+    def _thread_cpu_time():
+        r = resource.getrusage(resource.RUSAGE_THREAD)
+        return r.ru_utime + r.ru_stime
+else:
+    _thread_cpu_time = _cpu_time
+
+
+def _status(field):
+    # Value of a kB field of /proc/self/status in bytes, None elsewhere.
+    try:
+        with open('/proc/self/status') as fp:
+            for line in fp:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def current_rss():
+    """
+    Resident memory of the process in bytes, or None where unknown.
+    """
+    return _status('VmRSS')
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident memory of the process to its current value,
+    on Linux 4.0 and later; returns whether it could.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as fp:
+            fp.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def peak_rss():
+    """
+    Peak resident memory of the process in bytes, since the last
+    reset_peak_rss if any.
+    """
+    peak = _status('VmHWM')
+    if peak is None:
+        # ru_maxrss is in kB on Linux, never reset.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return peak
+
+
+class _Record(object):
+
+    def __init__(self, name, bytes_in):
+        self.name = name
+        self.bytes_in = bytes_in
+        self.bytes_out = 0
+
+    def output(self, *arrays):
+        """
+        Count the arrays produced by the stage.
+        """
+        self.bytes_out += nbytes(*arrays)
+
+
+class _Null(object):
+
+    def output(self, *arrays):
+        pass
+
+
+class Profiler(object):
+    """
+    Wall time, CPU time, bytes in and out and resident memory growth of
+    the stages of a run.
+
+    Stages on other threads than the one that created the profiler, e.g.
+    the prefetched reads, are charged the CPU time of their own thread.
+    Stages on the creating thread are charged the CPU time of the whole
+    process, which includes tomopy's worker threads, minus that of the
+    other threads' stages that ended meanwhile. The cpu/wall ratio of a
+    stage tells what bounds it: well below 1 the stage mostly waits,
+    typically for the disk; around or above 1 it computes, on as many
+    cores as the ratio.
+
+    The memory growth of a stage is its peak resident memory above the
+    resident memory at its start. The process peak is reset when a stage
+    starts with no other stage running, so overlapping stages share the
+    peak of their overlap.
+
+    Parameters
+    ----------
+    label : str, optional
+        Name of the dataset, stored in the report.
+    """
+
+    def __init__(self, label=None):
+        self.label = label
+        self.records = []
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._owner = threading.current_thread()
+        # CPU time of the finished stages of the other threads, and the
+        # number of stages running.
+        self._other_cpu = 0.0
+        self._running = 0
+
+    @contextlib.contextmanager
+    def stage(self, name, *inputs):
+        """
+        Time the body of the with statement as stage name; inputs are
+        the arrays it reads. Yields a record whose output method counts
+        the arrays it produces.
+        """
+        record = _Record(name, nbytes(*inputs))
+        owner = threading.current_thread() is self._owner
+        with self._lock:
+            if self._running == 0:
+                reset_peak_rss()
+            self._running += 1
+            other = self._other_cpu
+        rss = current_rss()
+        if rss is None:
+            rss = peak_rss()
+        wall = time.time()
+        cpu = _cpu_time() if owner else _thread_cpu_time()
+        try:
+            yield record
+        finally:
+            if owner:
+                with self._lock:
+                    other = self._other_cpu - other
+                cpu = max(0.0, _cpu_time() - cpu - other)
+            else:
+                cpu = _thread_cpu_time() - cpu
+            entry = {'stage': name,
+                     'start': wall - self._start,
+                     'wall': time.time() - wall,
+                     'cpu': cpu,
+                     'bytes_in': record.bytes_in,
+                     'bytes_out': record.bytes_out,
+                     'rss_growth': max(0, peak_rss() - rss)}
+            with self._lock:
+                self._running -= 1
+                if not owner:
+                    self._other_cpu += cpu
+                self.records.append(entry)
+
+    def summary(self):
+        """
+        One row per stage, in order of first appearance, with the totals
+        of all its calls and the largest memory growth of any.
+        """
+        rows = {}
+        order = []
+        for r in self.records:
+            if r['stage'] not in rows:
+                order.append(r['stage'])
+                rows[r['stage']] = {'stage': r['stage'], 'calls': 0, 'wall': 0.0, 'cpu': 0.0,
+                                    'bytes_in': 0, 'bytes_out': 0, 'rss_growth': 0}
+            row = rows[r['stage']]
+            row['calls'] += 1
+            for key in ('wall', 'cpu', 'bytes_in', 'bytes_out'):
+                row[key] += r[key]
+            row['rss_growth'] = max(row['rss_growth'], r['rss_growth'])
+        for row in rows.values():
+            wall = max(row['wall'], 1e-9)
+            row['cpu_ratio'] = row['cpu'] / wall
+            row['mb_per_s'] = max(row['bytes_in'], row['bytes_out']) / 1e6 / wall
+            row['bound'] = 'io' if row['cpu_ratio'] < 0.5 else 'compute'
+        return [rows[name] for name in order]
+
+    def report(self):
+        """
+        The summary and the individual records as a dict.
+        """
+        return {'label': self.label,
+                'wall': time.time() - self._start,
+                'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                'stages': self.summary(),
+                'records': list(self.records)}
+
+    def write(self, fname):
+        """
+        Write the report as JSON, or the summary as CSV when fname ends
+        with .csv.
+        """
+        if fname.endswith('.csv'):
+            with open(fname, 'w') as fp:
+                writer = csv.DictWriter(fp, fieldnames=fields)
+                writer.writeheader()
+                for row in self.summary():
+                    writer.writerow(row)
+        else:
+            with open(fname, 'w') as fp:
+                json.dump(self.report(), fp, indent=2, sort_keys=True)
+
+    def show(self):
+        """
+        Print the summary.
+        """
+        print ("{:18s} {:>6s} {:>9s} {:>9s} {:>6s} {:>10s} {:>10s} {:>9s} {:>9s} {:>8s}".format(
+            'stage', 'calls', 'wall s', 'cpu s', 'cpu/w', 'in MB', 'out MB', 'MB/s', 'rss+ MB', 'bound'))
+        for r in self.summary():
+            print ("{:18s} {:6d} {:9.2f} {:9.2f} {:6.2f} {:10.1f} {:10.1f} {:9.1f} {:9.1f} {:>8s}".format(
+                r['stage'], r['calls'], r['wall'], r['cpu'], r['cpu_ratio'], r['bytes_in'] / 1e6,
+                r['bytes_out'] / 1e6, r['mb_per_s'], r['rss_growth'] / 1e6, r['bound']))
+
+
+@contextlib.contextmanager
+def profiling(fname=None, label=None):
+    """
+    Collect the stages run inside the with statement, see stage, and
+    write the report to fname, if given, at the end.
+
+    Yields
+    ------
+    Profiler
+        The active profiler.
+    """
+    global _active
+    previous = _active
+    _active = Profiler(label)
+    try:
+        yield _active
+    finally:
+        prof, _active = _active, previous
+        if fname is not None:
+            prof.write(fname)
+
+
+@contextlib.contextmanager
+def stage(name, *inputs):
+    """
+    Time a stage with the active profiler, if any; see Profiler.stage.
+    Without an active profiler this costs next to nothing.
+    """
+    if _active is None:
+        yield _Null()
+    else:
+        with _active.stage(name, *inputs) as record:
+            yield record
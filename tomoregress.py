@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Check conversion and reconstruction throughput and memory against baselines
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+import convert_manifest
+import dxconvert
+import dxfile.dxtomo as dx
+import recpipe
+import tomobench
+import tomoprof
+
+__all__ = ['workloads',
+           'run_workload',
+           'run_workloads',
+           'compare']
+
+# (projections, rows, columns) of the replayed datasets.
+default_shape = (180, 32, 256)
+
+# Baselines of the workloads, created by --update and committed.
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baseline.json')
+
+# Phase retrieval parameters of rec_tomo_00068.
+phase = {'pixel_size': 4.1e-4, 'dist': 150, 'energy': 14.0}
+
+
+def _timed(func, *args, **kwargs):
+    """
+    Wall time of func(*args, **kwargs) and the growth of the resident
+    memory of the process it causes, above the memory held before.
+    """
+    tomoprof.reset_peak_rss()
+    rss = tomoprof.current_rss()
+    if rss is None:
+        rss = tomoprof.peak_rss()
+    t = time.time()
+    func(*args, **kwargs)
+    return time.time() - t, max(0, tomoprof.peak_rss() - rss)
+
+
+def _convert(layout):
+    def workload(workdir, shape):
+        proj, flat, dark = tomobench.synthetic_projections(*shape)
+        raw_dir = os.path.join(workdir, 'raw')
+        os.makedirs(raw_dir)
+        source = tomobench.writers[layout](raw_dir, proj, flat, dark)
+        nbytes = proj.nbytes + flat.nbytes + dark.nbytes
+        del proj, flat, dark
+        ds = dict(source, name=layout, format=layout, output=os.path.join(workdir, 'converted.h5'))
+        return _timed(convert_manifest.convert_dataset, ds) + (nbytes,)
+    return workload
+
+
+def _write_dx(fname, proj, flat, dark):
+    f = dxconvert.open_partial(fname, resume=False)
+    f.add_entry(dx.Entry.sample(name={'value': 'synthetic'}))
+    dxconvert.write_data(f, proj, flat, dark, np.linspace(0, 180, proj.shape[0], endpoint=False),
+                         chunks='projection')
+    dxconvert.finish(f, fname)
+
+
+def _rec(**kwargs):
+    def workload(workdir, shape):
+        proj, flat, dark = tomobench.synthetic_projections(*shape)
+        fname = os.path.join(workdir, 'data.h5')
+        _write_dx(fname, proj, flat, dark)
+        nbytes = proj.nbytes + flat.nbytes + dark.nbytes
+        del proj, flat, dark
+        return _timed(recpipe.reconstruct_volume, fname, (shape[2] - 1) / 2.0,
+                      os.path.join(workdir, 'rec', 'rec'),
+                      block=shape[1], tune=False, **kwargs) + (nbytes,)
+    return workload
+
+
+def _phantom(workdir, shape):
+    # As the phantom_* scripts: float projections, a single flat of ones
+    # and dark of zeros, written in memory with write_data.
+    proj, flat, dark = tomobench.synthetic_projections(*shape, nflat=1, ndark=1)
+    proj = proj.astype(np.float32) / flat[0]
+    flat = np.ones(flat.shape, dtype=np.float32)
+    dark = np.zeros(dark.shape, dtype=np.float32)
+    return _timed(_write_dx, os.path.join(workdir, 'phantom.h5'), proj, flat, dark) + \
+        (proj.nbytes + flat.nbytes + dark.nbytes,)
+
+
+# Each workload takes a scratch directory and a dataset shape, prepares
+# its input and returns the wall time and memory growth of its timed part,
+# see _timed, and the raw bytes it went through.
+workloads = {'convert_aps_2bm': _convert('aps_2bm'),
+             'convert_anka': _convert('anka'),
+             'convert_tomcat': _convert('tomcat'),
+             'convert_elettra': _convert('elettra'),
+             'phantom_write': _phantom,
+             'rec_absorption': _rec(),
+             'rec_phase': _rec(**phase)}
+
+
+def run_workload(name, shape, workdir):
+    """
+    Run a workload; see run_workloads.
+
+    Returns
+    -------
+    dict
+        'seconds', 'mb_s' and 'rss_growth', the peak resident memory the
+        timed part adds in bytes.
+    """
+    os.makedirs(workdir)
+    try:
+        seconds, growth, nbytes = workloads[name](workdir, shape)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'seconds': seconds,
+            'mb_s': nbytes / 1e6 / max(seconds, 1e-9),
+            'rss_growth': growth}
+
+
+def run_workloads(names, shape=default_shape, repeat=3, workdir=None):
+    """
+    Run each workload repeat times, each time in a fresh process, and
+    keep its best throughput and lowest memory growth, which vary less
+    from run to run than averages.
+
+    Returns
+    -------
+    dict
+        Result of each workload.
+    """
+    base = tempfile.mkdtemp(dir=workdir)
+    results = {}
+    try:
+        for name in names:
+            runs = [tomobench.run_isolated(run_workload, name, shape, os.path.join(base, '{}_{}'.format(name, k)))
+                    for k in range(repeat)]
+            results[name] = {'seconds': min(r['seconds'] for r in runs),
+                             'mb_s': max(r['mb_s'] for r in runs),
+                             'rss_growth': min(r['rss_growth'] for r in runs)}
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+    return results
+
+
+def compare(baseline, results, tolerance=0.25, memory_tolerance=None):
+    """
+    Compare results with baseline results.
+
+    A workload regresses when its throughput drops by more than
+    tolerance, or its memory growth by more than memory_tolerance
+    (defaults to tolerance), relative to the baseline.
+
+    Returns
+    -------
+    list of tuple
+        (workload, metric, baseline, current, relative change, status)
+        rows, status being 'ok', 'REGRESSED', 'improved' or 'new'.
+    """
+    if memory_tolerance is None:
+        memory_tolerance = tolerance
+    rows = []
+    for name in sorted(results):
+        for metric, worse, tol in (('mb_s', -1, tolerance), ('rss_growth', 1, memory_tolerance)):
+            current = results[name][metric]
+            if name not in baseline:
+                rows.append((name, metric, None, current, None, 'new'))
+                continue
+            ref = baseline[name][metric]
+            change = (current - ref) / float(ref) if ref else 0.0
+            if worse * change > tol:
+                status = 'REGRESSED'
+            elif -worse * change > tol:
+                status = 'improved'
+            else:
+                status = 'ok'
+            rows.append((name, metric, ref, current, change, status))
+    return rows
+
+
+def _fmt(metric, value):
+    if value is None:
+        return '-'
+    if metric == 'rss_growth':
+        return '{:.1f} MB'.format(value / 1e6)
+    return '{:.1f} MB/s'.format(value)
+
+
+def _show(rows):
+    print ("{:18s} {:>10s} {:>14s} {:>14s} {:>9s}  {}".format('workload', 'metric', 'baseline', 'current', 'change', 'status'))
+    for name, metric, ref, current, change, status in rows:
+        print ("{:18s} {:>10s} {:>14s} {:>14s} {:>9s}  {}".format(
+            name, metric, _fmt(metric, ref), _fmt(metric, current),
+            '-' if change is None else '{:+.1%}'.format(change), status))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--baseline', default=default_baseline, help='JSON baseline file')
+    parser.add_argument('--only', default=None, help='comma separated workloads to run')
+    parser.add_argument('--shape', default=','.join(str(n) for n in default_shape), help='projections,rows,columns')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per workload')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative throughput drop')
+    parser.add_argument('--memory-tolerance', type=float, default=None,
+                        help='allowed relative peak memory growth (default: --tolerance)')
+    parser.add_argument('--workdir', default=None, help='scratch directory (default: system temporary directory)')
+    parser.add_argument('--update', action='store_true', help='store the results as the new baseline')
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else sorted(workloads)
+    shape = tuple(int(n) for n in args.shape.split(','))
+
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+    machine = tomobench.machine()
+    if baseline and baseline.get('shape') != list(shape):
+        if not args.update:
+            sys.exit('baseline was made with shape {}, not {}'.format(baseline.get('shape'), list(shape)))
+        # A new shape starts a new baseline.
+        baseline = {}
+    if not args.update:
+        # Without a reference every workload would pass as new.
+        if not baseline:
+            sys.exit('no baseline in {}; record one with --update'.format(args.baseline))
+        missing = [name for name in names if name not in baseline.get('results', {})]
+        if missing:
+            sys.exit('no baseline for {} in {}; record them with --update'.format(', '.join(missing), args.baseline))
+    if baseline and baseline.get('machine', {}).get('host') != machine['host']:
+        print ("Warning: baseline was made on {}, timings may not compare".format(baseline['machine'].get('host')))
+
+    results = run_workloads(names, shape, args.repeat, args.workdir)
+    rows = compare(baseline.get('results', {}), results, args.tolerance, args.memory_tolerance)
+    _show(rows)
+
+    if args.update:
+        merged = dict(baseline.get('results', {}), **results)
+        dirPath = os.path.dirname(args.baseline)
+        if dirPath and not os.path.exists(dirPath):
+            os.makedirs(dirPath)
+        with open(args.baseline, 'w') as fp:
+            json.dump({'machine': machine, 'shape': list(shape), 'results': merged}, fp, indent=2, sort_keys=True)
+        print ("Baseline updated: ", args.baseline)
+        sys.exit(0)
+    sys.exit(1 if any(row[-1] == 'REGRESSED' for row in rows) else 0)